@@ -9,9 +9,33 @@ load_dotenv()
 
 class Settings(BaseModel):
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./assistant.db")
+    database_read_url: str = os.getenv("DATABASE_READ_URL", "")
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    db_pool_recycle_s: int = int(os.getenv("DB_POOL_RECYCLE_S", "1800"))
+    db_pool_timeout_s: int = int(os.getenv("DB_POOL_TIMEOUT_S", "30"))
+    sqlite_busy_timeout_ms: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    sqlite_mmap_bytes: int = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+    sqlite_cache_kib: int = int(os.getenv("SQLITE_CACHE_KIB", "65536"))
+    auto_migrate: bool = os.getenv("AUTO_MIGRATE", "false").lower() == "true"
     anthropic_key: str = os.getenv("ANTHROPIC_API_KEY", "")
     default_tz: str = os.getenv("DEFAULT_TZ", "America/Los_Angeles")
     enable_scheduler: bool = os.getenv("ENABLE_SCHEDULER", "true").lower() == "true"
+    planner_engine: str = os.getenv("PLANNER_ENGINE", "llm")  # local|llm|hybrid
+    planner_context_tokens: int = int(os.getenv("PLANNER_CONTEXT_TOKENS", "1500"))
+    planner_repair_attempts: int = int(os.getenv("PLANNER_REPAIR_ATTEMPTS", "1"))
+    plan_concurrency: int = int(os.getenv("PLAN_CONCURRENCY", "16"))
+    plan_cache_backend: str = os.getenv("PLAN_CACHE_BACKEND", "memory")  # memory|sqlite|off
+    plan_cache_path: str = os.getenv("PLAN_CACHE_PATH", "./plan_cache.db")
+    plan_cache_ttl_s: int = int(os.getenv("PLAN_CACHE_TTL_S", "21600"))
+    plan_cache_max: int = int(os.getenv("PLAN_CACHE_MAX", "2048"))
+    user_state_reconcile_s: int = int(os.getenv("USER_STATE_RECONCILE_S", "86400"))
+    chat_pool_max: int = int(os.getenv("CHAT_POOL_MAX", "256"))
+    chat_idle_ttl_s: int = int(os.getenv("CHAT_IDLE_TTL_S", "1800"))
+    extract_batch_size: int = int(os.getenv("EXTRACT_BATCH_SIZE", "25"))
+    intent_rules_ttl_s: float = float(os.getenv("INTENT_RULES_TTL_S", "30"))
+    invite_search_days: int = int(os.getenv("INVITE_SEARCH_DAYS", "7"))
+    page_size: int = int(os.getenv("PAGE_SIZE", "50"))
 
     google_client_id: str = os.getenv("GOOGLE_CLIENT_ID", "")
     google_client_secret: str = os.getenv("GOOGLE_CLIENT_SECRET", "")
@@ -19,6 +43,9 @@ class Settings(BaseModel):
     google_scopes: str = os.getenv(
         "GOOGLE_SCOPES", "https://www.googleapis.com/auth/calendar"
     )
+    # Public HTTPS URL of /v1/calendar/notify; empty -> local stand-in channels.
+    google_webhook_url: str = os.getenv("GOOGLE_WEBHOOK_URL", "")
+    calendar_debounce_s: float = float(os.getenv("CALENDAR_DEBOUNCE_S", "2"))
 
 
 settings = Settings()
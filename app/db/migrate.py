@@ -0,0 +1,198 @@
+"""
+Versioned schema migrations, run at deploy time:
+
+    python -m app.db.migrate upgrade          # to head
+    python -m app.db.migrate downgrade 1      # back to revision 1 (0 = empty)
+    python -m app.db.migrate current
+    python -m app.db.migrate check            # EXPLAIN hot queries, fail on full scans
+
+The applied revision lives in a one-row `schema_version` table.
+"""
+import importlib
+import pkgutil
+import sys
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.db import migrations
+from app.db.session import engine as default_engine
+
+# Make sure every mapped table is registered on Base.metadata before revisions run.
+from app.models import (  # noqa: F401
+    user,
+    task,
+    goal,
+    stressor,
+    preference,
+    trait,
+    plan,
+    message,
+    calendar_account,
+    event,
+    activity,
+    user_state,
+    resource_version,
+)
+
+VERSION_TABLE = "schema_version"
+
+
+def load_revisions() -> list:
+    mods = []
+    for info in pkgutil.iter_modules(migrations.__path__):
+        if info.name.startswith("v"):
+            mods.append(importlib.import_module(f"{migrations.__name__}.{info.name}"))
+    mods.sort(key=lambda m: m.revision)
+    revs = [m.revision for m in mods]
+    if revs != list(range(1, len(revs) + 1)):
+        raise RuntimeError(f"migration revisions must be 1..N without gaps, got {revs}")
+    return mods
+
+
+def head() -> int:
+    return len(load_revisions())
+
+
+def _ensure_version_table(conn: Connection) -> None:
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (version INTEGER NOT NULL)"))
+    if conn.execute(text(f"SELECT COUNT(*) FROM {VERSION_TABLE}")).scalar() == 0:
+        conn.execute(text(f"INSERT INTO {VERSION_TABLE} (version) VALUES (0)"))
+
+
+def _set_version(conn: Connection, version: int) -> None:
+    conn.execute(text(f"UPDATE {VERSION_TABLE} SET version = :v"), {"v": version})
+
+
+def current(engine: Engine = default_engine) -> int:
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return conn.execute(text(f"SELECT version FROM {VERSION_TABLE}")).scalar()
+
+
+def upgrade(target: int | None = None, engine: Engine = default_engine) -> int:
+    """Apply revisions above the current one up to `target` (default: head)."""
+    mods = load_revisions()
+    target = len(mods) if target is None else target
+    if not 0 <= target <= len(mods):
+        raise ValueError(f"unknown revision {target}")
+    at = current(engine)
+    for mod in mods[at:target]:
+        # One transaction per revision so a failure leaves a consistent version.
+        with engine.begin() as conn:
+            mod.upgrade(conn)
+            _set_version(conn, mod.revision)
+        print(f"upgrade  -> {mod.revision:04d} {mod.description}")
+    return max(at, target)
+
+
+def downgrade(target: int, engine: Engine = default_engine) -> int:
+    """Revert revisions above `target`, newest first."""
+    mods = load_revisions()
+    if not 0 <= target <= len(mods):
+        raise ValueError(f"unknown revision {target}")
+    at = current(engine)
+    for mod in reversed(mods[target:at]):
+        with engine.begin() as conn:
+            mod.downgrade(conn)
+            _set_version(conn, mod.revision - 1)
+        print(f"downgrade <- {mod.revision:04d} {mod.description}")
+    return min(at, target)
+
+
+# Shapes of the hot queries (plan_today, list_events, tasks_fragment, list_goals,
+# upsert_preference, inbox dedupe/extraction, activity rollup, keyset pages)
+# with the index each one must use.
+HOT_QUERIES = [
+    (
+        "ix_task_user_status_impact_id",
+        "SELECT * FROM task WHERE user_id = :u AND status = 'open' ORDER BY impact DESC LIMIT 50",
+    ),
+    (
+        "ix_event_user_start_id",
+        "SELECT * FROM event WHERE user_id = :u AND start >= :a AND start < :b ORDER BY start",
+    ),
+    (
+        "ix_goal_user_horizon_created_id",
+        "SELECT * FROM goal WHERE user_id = :u ORDER BY horizon, created_at",
+    ),
+    (
+        "ix_preference_user_key",
+        "SELECT * FROM preference WHERE user_id = :u AND key = :k",
+    ),
+    (
+        "uq_message_user_body_hash",
+        "SELECT id FROM message WHERE user_id = :u AND body_hash = :h",
+    ),
+    (
+        "ix_message_user_intent_processed",
+        "SELECT * FROM message WHERE user_id = :u AND intent IN ('invite', 'task') AND processed_at IS NULL",
+    ),
+    (
+        "ix_event_user_activity_start",
+        "SELECT activity, MAX(start) FROM event WHERE user_id = :u AND activity IS NOT NULL "
+        "GROUP BY activity",
+    ),
+    (
+        "ix_task_user_status_impact_id",
+        "SELECT * FROM task WHERE user_id = :u AND status >= :k AND (status > :k OR "
+        "(status = :k AND impact < 3) OR (status = :k AND impact = 3 AND id > :h)) "
+        "ORDER BY status, impact DESC, id LIMIT 51",
+    ),
+    (
+        "ix_event_user_start_id",
+        "SELECT * FROM event WHERE user_id = :u AND (start, id) > (:a, :h) ORDER BY start, id LIMIT 51",
+    ),
+    (
+        "ix_goal_user_horizon_created_id",
+        "SELECT * FROM goal WHERE user_id = :u AND (horizon, created_at, id) > (:k, :a, :h) "
+        "ORDER BY horizon, created_at, id LIMIT 51",
+    ),
+    (
+        "ix_stressor_user_id",
+        "SELECT * FROM stressor WHERE user_id = :u AND id > :h ORDER BY id LIMIT 51",
+    ),
+]
+
+
+def check_query_plans(engine: Engine = default_engine) -> list[str]:
+    """Run EXPLAIN QUERY PLAN for each hot query; return the ones missing their index."""
+    if engine.dialect.name != "sqlite":
+        return []
+    params = {"u": "", "a": "1970-01-01", "b": "1970-01-02", "k": "", "h": ""}
+    problems = []
+    # Pooled SQLite connections cache prepared EXPLAIN statements across DDL; start fresh.
+    engine.dispose()
+    with engine.connect() as conn:
+        for index, sql in HOT_QUERIES:
+            rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).all()
+            detail = " | ".join(r[-1] for r in rows)
+            if index not in detail:
+                problems.append(f"{index}: {detail}")
+    return problems
+
+
+def main(argv: list[str]) -> int:
+    cmd = argv[0] if argv else "upgrade"
+    if cmd == "upgrade":
+        upgrade(int(argv[1]) if len(argv) > 1 else None)
+    elif cmd == "downgrade":
+        if len(argv) < 2:
+            print("usage: python -m app.db.migrate downgrade <revision>")
+            return 2
+        downgrade(int(argv[1]))
+    elif cmd == "current":
+        print(f"{current()} (head {head()})")
+    elif cmd == "check":
+        problems = check_query_plans()
+        for p in problems:
+            print(f"NO INDEX  {p}")
+        return 1 if problems else 0
+    else:
+        print(f"unknown command {cmd!r}; expected upgrade|downgrade|current|check")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,25 @@
+"""
+Numbered schema revisions. Each module `vNNNN_<name>.py` defines:
+
+    revision: int
+    description: str
+    def upgrade(conn): ...
+    def downgrade(conn): ...
+
+Revisions should be idempotent (check before create/drop) so they can adopt
+databases that were created by the old `create_all` at import time.
+"""
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection
+
+
+def has_table(conn: Connection, table: str) -> bool:
+    return inspect(conn).has_table(table)
+
+
+def has_index(conn: Connection, table: str, name: str) -> bool:
+    return any(ix["name"] == name for ix in inspect(conn).get_indexes(table))
+
+
+def has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
@@ -0,0 +1,33 @@
+from sqlalchemy.schema import CreateTable, DropTable
+
+from app.db.base import Base
+from app.db.migrations import has_table
+
+revision = 1
+description = "baseline tables (as previously created by create_all)"
+
+TABLES = [
+    "user",
+    "task",
+    "goal",
+    "stressor",
+    "preference",
+    "trait",
+    "plan",
+    "message",
+    "calendar_account",
+    "event",
+]
+
+
+def upgrade(conn):
+    # CREATE TABLE only; indexes are owned by later revisions.
+    for t in Base.metadata.sorted_tables:
+        if t.name in TABLES and not has_table(conn, t.name):
+            conn.execute(CreateTable(t))
+
+
+def downgrade(conn):
+    for t in reversed(Base.metadata.sorted_tables):
+        if t.name in TABLES and has_table(conn, t.name):
+            conn.execute(DropTable(t))
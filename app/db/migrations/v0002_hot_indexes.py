@@ -0,0 +1,39 @@
+from sqlalchemy import Index
+
+from app.db.base import Base
+from app.db.migrations import has_index
+
+revision = 2
+description = "composite indexes for planner, listings and preference upserts"
+
+# name, table, columns ("-col" = descending)
+INDEXES = [
+    # plan_today (status='open' ORDER BY impact DESC) and tasks_fragment (status, impact DESC)
+    ("ix_task_user_status_impact", "task", ["user_id", "status", "-impact"]),
+    # list_events / plan_today / list_today_events range scans on start
+    ("ix_event_user_start", "event", ["user_id", "start"]),
+    # list_goals ORDER BY horizon, created_at
+    ("ix_goal_user_horizon", "goal", ["user_id", "horizon", "created_at"]),
+    # upsert_preference lookup
+    ("ix_preference_user_key", "preference", ["user_id", "key"]),
+    # inbox de-duplication lookups
+    ("ix_message_user_body_hash", "message", ["user_id", "body_hash"]),
+]
+
+
+def _index(name, table, cols) -> Index:
+    t = Base.metadata.tables[table]
+    exprs = [t.c[c[1:]].desc() if c.startswith("-") else t.c[c] for c in cols]
+    return Index(name, *exprs)
+
+
+def upgrade(conn):
+    for name, table, cols in INDEXES:
+        if not has_index(conn, table, name):
+            _index(name, table, cols).create(conn)
+
+
+def downgrade(conn):
+    for name, table, cols in INDEXES:
+        if has_index(conn, table, name):
+            _index(name, table, cols).drop(conn)
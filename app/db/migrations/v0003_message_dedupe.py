@@ -0,0 +1,62 @@
+from sqlalchemy import Index, bindparam, select, text, update
+
+from app.db.base import Base
+from app.db.migrations import has_index
+
+revision = 3
+description = "unique (user_id, body_hash) on message for idempotent inbox ingestion"
+
+OLD = "ix_message_user_body_hash"
+NEW = "uq_message_user_body_hash"
+BACKFILL_CHUNK = 1000
+
+
+def _index(name: str, unique: bool) -> Index:
+    t = Base.metadata.tables["message"]
+    return Index(name, t.c.user_id, t.c.body_hash, unique=unique)
+
+
+def _rehash(conn) -> None:
+    """Legacy rows hashed the body alone, so every empty-body message shared
+    sha256(""). Recompute with inbox.message_hash (headers when the body is
+    empty) so the dedupe below only collapses what ingestion would treat as a replay."""
+    from app.services.inbox import message_hash
+
+    t = Base.metadata.tables["message"]
+    rows = conn.execute(
+        select(t.c.id, t.c.channel, t.c.from_addr, t.c.subject, t.c.data, t.c.body_hash)
+    ).all()
+    fixed = []
+    for mid, channel, from_addr, subject, data, old in rows:
+        # `data` is the original relay payload; fall back to the columns it was split into.
+        payload = data if isinstance(data, dict) else {"channel": channel, "from": from_addr, "subject": subject}
+        h = message_hash(payload)
+        if h != old:
+            fixed.append({"_id": mid, "_hash": h})
+    stmt = update(t).where(t.c.id == bindparam("_id")).values(body_hash=bindparam("_hash"))
+    for i in range(0, len(fixed), BACKFILL_CHUNK):
+        conn.execute(stmt, fixed[i : i + BACKFILL_CHUNK])
+
+
+def upgrade(conn):
+    _rehash(conn)
+    # Relay replays already stored duplicates; keep the earliest copy of each.
+    conn.execute(
+        text(
+            "DELETE FROM message WHERE body_hash IS NOT NULL AND id NOT IN ("
+            " SELECT id FROM (SELECT id, ROW_NUMBER() OVER ("
+            "  PARTITION BY user_id, body_hash ORDER BY ts, id) AS rn FROM message) d"
+            " WHERE rn = 1)"
+        )
+    )
+    if not has_index(conn, "message", NEW):
+        _index(NEW, unique=True).create(conn)
+    if has_index(conn, "message", OLD):
+        _index(OLD, unique=False).drop(conn)
+
+
+def downgrade(conn):
+    if not has_index(conn, "message", OLD):
+        _index(OLD, unique=False).create(conn)
+    if has_index(conn, "message", NEW):
+        _index(NEW, unique=True).drop(conn)
@@ -0,0 +1,29 @@
+from sqlalchemy import DateTime, Index, text
+
+from app.db.base import Base
+from app.db.migrations import has_column, has_index
+
+revision = 4
+description = "message.processed_at for the inbox extraction stage"
+
+INDEX = "ix_message_user_intent_processed"
+
+
+def _index() -> Index:
+    t = Base.metadata.tables["message"]
+    return Index(INDEX, t.c.user_id, t.c.intent, t.c.processed_at)
+
+
+def upgrade(conn):
+    if not has_column(conn, "message", "processed_at"):
+        coltype = DateTime().compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE message ADD COLUMN processed_at {coltype}"))
+    if not has_index(conn, "message", INDEX):
+        _index().create(conn)
+
+
+def downgrade(conn):
+    if has_index(conn, "message", INDEX):
+        _index().drop(conn)
+    if has_column(conn, "message", "processed_at"):
+        conn.execute(text("ALTER TABLE message DROP COLUMN processed_at"))
@@ -0,0 +1,54 @@
+from sqlalchemy import Index, String, bindparam, select, text, update
+from sqlalchemy.schema import CreateTable, DropTable
+
+from app.db.base import Base
+from app.db.migrations import has_column, has_index, has_table
+
+revision = 5
+description = "event.activity category tags and the activity_rollup table"
+
+INDEX = "ix_event_user_activity_start"
+BACKFILL_CHUNK = 1000
+
+
+def _index() -> Index:
+    t = Base.metadata.tables["event"]
+    return Index(INDEX, t.c.user_id, t.c.activity, t.c.start)
+
+
+def upgrade(conn):
+    from app.services.activity import categorize
+
+    if not has_column(conn, "event", "activity"):
+        coltype = String().compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE event ADD COLUMN activity {coltype}"))
+    if not has_index(conn, "event", INDEX):
+        _index().create(conn)
+    if not has_table(conn, "activity_rollup"):
+        conn.execute(CreateTable(Base.metadata.tables["activity_rollup"]))
+
+    # Tag existing events, then build the rollup from the new index.
+    ev = Base.metadata.tables["event"]
+    rows = conn.execute(select(ev.c.id, ev.c.summary).where(ev.c.activity.is_(None))).all()
+    tagged = [{"_id": i, "_activity": categorize(s)} for i, s in rows]
+    tagged = [r for r in tagged if r["_activity"]]
+    stmt = update(ev).where(ev.c.id == bindparam("_id")).values(activity=bindparam("_activity"))
+    for i in range(0, len(tagged), BACKFILL_CHUNK):
+        conn.execute(stmt, tagged[i : i + BACKFILL_CHUNK])
+    conn.execute(text("DELETE FROM activity_rollup"))
+    conn.execute(
+        text(
+            "INSERT INTO activity_rollup (user_id, category, last_start, updated_at) "
+            "SELECT user_id, activity, MAX(start), CURRENT_TIMESTAMP FROM event "
+            "WHERE activity IS NOT NULL GROUP BY user_id, activity"
+        )
+    )
+
+
+def downgrade(conn):
+    if has_table(conn, "activity_rollup"):
+        conn.execute(DropTable(Base.metadata.tables["activity_rollup"]))
+    if has_index(conn, "event", INDEX):
+        _index().drop(conn)
+    if has_column(conn, "event", "activity"):
+        conn.execute(text("ALTER TABLE event DROP COLUMN activity"))
@@ -0,0 +1,20 @@
+from sqlalchemy.schema import CreateTable, DropTable
+
+from app.db.base import Base
+from app.db.migrations import has_table
+
+revision = 6
+description = "user_state snapshot for agent nudges"
+
+# No backfill: a user's row is rebuilt from goals/tasks/activity_rollup the
+# first time it is read or written (services/user_state.py).
+
+
+def upgrade(conn):
+    if not has_table(conn, "user_state"):
+        conn.execute(CreateTable(Base.metadata.tables["user_state"]))
+
+
+def downgrade(conn):
+    if has_table(conn, "user_state"):
+        conn.execute(DropTable(Base.metadata.tables["user_state"]))
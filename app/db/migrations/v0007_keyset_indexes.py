@@ -0,0 +1,41 @@
+from sqlalchemy import Index
+
+from app.db.base import Base
+from app.db.migrations import has_index
+
+revision = 7
+description = "listing indexes ending in id for keyset pagination"
+
+# (new, replaces) with columns as in v0002 ("-col" = descending). Each new index
+# is the old one plus the id tiebreak, so the old one is dropped.
+INDEXES = [
+    (("ix_task_user_status_impact_id", "task", ["user_id", "status", "-impact", "id"]),
+     ("ix_task_user_status_impact", "task", ["user_id", "status", "-impact"])),
+    (("ix_goal_user_horizon_created_id", "goal", ["user_id", "horizon", "created_at", "id"]),
+     ("ix_goal_user_horizon", "goal", ["user_id", "horizon", "created_at"])),
+    (("ix_event_user_start_id", "event", ["user_id", "start", "id"]),
+     ("ix_event_user_start", "event", ["user_id", "start"])),
+    (("ix_stressor_user_id", "stressor", ["user_id", "id"]), None),
+]
+
+
+def _index(name, table, cols) -> Index:
+    t = Base.metadata.tables[table]
+    exprs = [t.c[c[1:]].desc() if c.startswith("-") else t.c[c] for c in cols]
+    return Index(name, *exprs)
+
+
+def upgrade(conn):
+    for new, old in INDEXES:
+        if not has_index(conn, new[1], new[0]):
+            _index(*new).create(conn)
+        if old and has_index(conn, old[1], old[0]):
+            _index(*old).drop(conn)
+
+
+def downgrade(conn):
+    for new, old in INDEXES:
+        if old and not has_index(conn, old[1], old[0]):
+            _index(*old).create(conn)
+        if has_index(conn, new[1], new[0]):
+            _index(*new).drop(conn)
@@ -0,0 +1,19 @@
+from sqlalchemy.schema import CreateTable, DropTable
+
+from app.db.base import Base
+from app.db.migrations import has_table
+
+revision = 8
+description = "resource_version counters for ETags"
+
+# No backfill: a missing row reads as version 0 and is created by the first write.
+
+
+def upgrade(conn):
+    if not has_table(conn, "resource_version"):
+        conn.execute(CreateTable(Base.metadata.tables["resource_version"]))
+
+
+def downgrade(conn):
+    if has_table(conn, "resource_version"):
+        conn.execute(DropTable(Base.metadata.tables["resource_version"]))
@@ -0,0 +1,41 @@
+from sqlalchemy import JSON, Column, DateTime, ForeignKey, MetaData, String, Table
+from sqlalchemy.schema import CreateTable, DropTable
+
+from app.db.base import Base
+from app.db.migrations import has_column, has_table
+
+revision = 9
+description = "user_state counters as per-key rows (atomic increments)"
+
+# user_state is derived data, so it is dropped and recreated rather than
+# converted; every user is rebuilt from goals/tasks on first read or write.
+
+
+def _legacy_user_state() -> Table:
+    """The v0006 shape, with the JSON counters read-modify-written in Python."""
+    return Table(
+        "user_state",
+        MetaData(),
+        Column("user_id", String, ForeignKey(Base.metadata.tables["user"].c.id), primary_key=True),
+        Column("goal_flags", JSON),
+        Column("open_tasks", JSON),
+        Column("cadence", JSON),
+        Column("updated_at", DateTime),
+    )
+
+
+def upgrade(conn):
+    if has_table(conn, "user_state") and not has_column(conn, "user_state", "rebuilt_at"):
+        conn.execute(DropTable(Base.metadata.tables["user_state"]))
+    if not has_table(conn, "user_state"):
+        conn.execute(CreateTable(Base.metadata.tables["user_state"]))
+    if not has_table(conn, "user_state_count"):
+        conn.execute(CreateTable(Base.metadata.tables["user_state_count"]))
+
+
+def downgrade(conn):
+    if has_table(conn, "user_state_count"):
+        conn.execute(DropTable(Base.metadata.tables["user_state_count"]))
+    if has_table(conn, "user_state") and has_column(conn, "user_state", "rebuilt_at"):
+        conn.execute(DropTable(Base.metadata.tables["user_state"]))
+        conn.execute(CreateTable(_legacy_user_state()))
@@ -0,0 +1,58 @@
+from sqlalchemy import bindparam, func, select, text, update
+
+from app.db.base import Base
+
+revision = 10
+description = "event.activity holds every matching category, not just the first"
+
+BACKFILL_CHUNK = 1000
+
+
+def _retag(conn, tag_of) -> None:
+    ev = Base.metadata.tables["event"]
+    rows = conn.execute(select(ev.c.id, ev.c.summary, ev.c.activity)).all()
+    changed = [
+        {"_id": i, "_activity": new}
+        for i, summary, old in rows
+        if (new := tag_of(summary, old)) != old
+    ]
+    stmt = update(ev).where(ev.c.id == bindparam("_id")).values(activity=bindparam("_activity"))
+    for i in range(0, len(changed), BACKFILL_CHUNK):
+        conn.execute(stmt, changed[i : i + BACKFILL_CHUNK])
+
+
+def _rebuild_rollup(conn) -> None:
+    """One row per (user, category); an event counts for every category in its tag."""
+    ev = Base.metadata.tables["event"]
+    latest: dict = {}
+    for user_id, tag, last in conn.execute(
+        select(ev.c.user_id, ev.c.activity, func.max(ev.c.start))
+        .where(ev.c.activity.isnot(None))
+        .group_by(ev.c.user_id, ev.c.activity)
+    ):
+        for cat in tag.split(","):
+            key = (user_id, cat)
+            if key not in latest or last > latest[key]:
+                latest[key] = last
+    conn.execute(text("DELETE FROM activity_rollup"))
+    if latest:
+        conn.execute(
+            text(
+                "INSERT INTO activity_rollup (user_id, category, last_start, updated_at) "
+                "VALUES (:u, :c, :s, CURRENT_TIMESTAMP)"
+            ),
+            [{"u": u, "c": c, "s": s} for (u, c), s in latest.items()],
+        )
+
+
+def upgrade(conn):
+    from app.services.activity import categorize
+
+    _retag(conn, lambda summary, old: categorize(summary))
+    _rebuild_rollup(conn)
+
+
+def downgrade(conn):
+    # The first category in a tag is what "first match wins" used to store.
+    _retag(conn, lambda summary, old: old.split(",")[0] if old else old)
+    _rebuild_rollup(conn)
@@ -0,0 +1,76 @@
+"""
+Keyset (cursor) pagination.
+
+A listing declares its sort keys as (column, descending) pairs ending in a
+unique column. A page is `WHERE <after cursor> ORDER BY keys LIMIT n + 1`, so
+its cost depends on the page size, not on how far the reader has scrolled.
+Cursors are opaque url-safe strings holding the last row's key values.
+
+Sort-key columns are assumed NOT NULL.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import DateTime, and_, or_, tuple_
+from sqlalchemy.orm import Query
+
+Key = Tuple[Any, bool]  # (mapped column, descending)
+
+
+def order_by(keys: Sequence[Key]) -> list:
+    return [col.desc() if desc else col.asc() for col, desc in keys]
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: Sequence[Key]) -> List[Any]:
+    """Raises ValueError for anything that is not a cursor for these keys."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError("invalid cursor")
+    return [
+        datetime.fromisoformat(v) if isinstance(col.type, DateTime) and isinstance(v, str) else v
+        for (col, _), v in zip(keys, values)
+    ]
+
+
+def after(keys: Sequence[Key], values: Sequence[Any]):
+    """Rows strictly after `values` in `keys` order."""
+    directions = {desc for _, desc in keys}
+    if len(directions) == 1:
+        # Uniform direction: a row-value comparison the index can seek on directly.
+        lhs, rhs = tuple_(*[c for c, _ in keys]), tuple_(*values)
+        return lhs < rhs if directions.pop() else lhs > rhs
+    # Mixed directions (e.g. status ASC, impact DESC): expand lexicographically,
+    # with a redundant bound on the first key so the index can still seek.
+    clauses = []
+    for i, (col, desc) in enumerate(keys):
+        prefix = [c == v for (c, _), v in zip(keys[:i], values[:i])]
+        clauses.append(and_(*prefix, col < values[i] if desc else col > values[i]))
+    first, desc = keys[0]
+    return and_(first <= values[0] if desc else first >= values[0], or_(*clauses))
+
+
+def key_of(row: Any, keys: Sequence[Key]) -> List[Any]:
+    return [getattr(row, col.key) for col, _ in keys]
+
+
+def paginate(
+    query: Query, keys: Sequence[Key], cursor: Optional[str], limit: int
+) -> Tuple[list, Optional[str]]:
+    """One page of `query` in `keys` order and the cursor for the next page (None on the last)."""
+    if cursor:
+        query = query.filter(after(keys, decode_cursor(cursor, keys)))
+    rows = query.order_by(*order_by(keys)).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key_of(rows[-1], keys))
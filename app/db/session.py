@@ -1,10 +1,57 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if settings.database_url.startswith("sqlite") else {},
-    pool_pre_ping=True,
-)
+
+def _sqlite_pragmas(read_only: bool):
+    def on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        # WAL lets readers run alongside a writer; NORMAL is durable enough under WAL.
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cur.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_bytes)}")
+        cur.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_kib)}")  # negative = KiB
+        cur.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cur.execute("PRAGMA query_only=ON")
+        cur.close()
+
+    return on_connect
+
+
+def make_engine(url: str, read_only: bool = False) -> Engine:
+    """Engine tuned per dialect: SQLite pragmas at connect time, real pool sizing elsewhere."""
+    if url.startswith("sqlite"):
+        eng = create_engine(
+            url,
+            connect_args={
+                "check_same_thread": False,
+                "timeout": settings.sqlite_busy_timeout_ms / 1000,
+            },
+            pool_pre_ping=True,
+        )
+        event.listen(eng, "connect", _sqlite_pragmas(read_only))
+        return eng
+    return create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_recycle=settings.db_pool_recycle_s,
+        pool_timeout=settings.db_pool_timeout_s,
+    )
+
+
+engine = make_engine(settings.database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Optional read-only engine (replica, or the same SQLite file with query_only)
+# for fragment/listing endpoints. Falls back to the primary engine.
+read_engine = (
+    make_engine(settings.database_read_url, read_only=True)
+    if settings.database_read_url
+    else engine
+)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
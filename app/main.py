@@ -4,17 +4,23 @@ from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
-from app.db.session import engine, SessionLocal
-from app.db.base import Base
+from app.db.session import SessionLocal
+from app.db import migrate
 from app.core.config import settings
 from app.core.time import day_bounds
 
 from app.routers import tasks as tasks_router
 from app.routers import goals_ui as goals_ui_router
 from app.routers import stress_ui as stress_ui_router
+from app.services import scheduler as planning_scheduler
+from app.services.google_calendar import refresh_expiring_tokens, aclose_http
+from app.services.calendar_watch import renew_expiring_channels
+from app.services.extraction import process_pending as extract_inbox
+from app.services import versions
 
-# --- Import all models so create_all sees them ---
+# --- Import all models so they are mapped before any query ---
 from app.models import (
     user,
     task,
@@ -26,6 +32,9 @@ from app.models import (
     message,
     calendar_account,
     event,
+    activity,
+    user_state,
+    resource_version,
 )
 from app.models.user import User
 from app.models.plan import Plan
@@ -42,9 +51,6 @@ from app.routers import (
     calendar as calendar_router,
 )
 
-# Create tables (SQLite)
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI(title="DoneGlow - My Personal Assistant")
 
 # Register routers (order doesn't really matter)
@@ -70,8 +76,14 @@ async def index(request: Request):
     try:
         user_row = db.query(User).first()
         plan_row = None
+        etag = None
         if user_row:
             start, end = day_bounds(user_row.tz)
+            # Today's saved plan only changes on save_plan or at local midnight.
+            etag = versions.etag(db, user_row.id, "plan", start.isoformat())
+            cached = versions.not_modified(request, etag)
+            if cached is not None:
+                return cached
             plan_row = (
                 db.query(Plan)
                 .filter(
@@ -79,9 +91,10 @@ async def index(request: Request):
                 )
                 .one_or_none()
             )
-        return templates.TemplateResponse(
+        response = templates.TemplateResponse(
             "index.html", {"request": request, "plan": plan_row}
         )
+        return versions.tagged(response, etag) if etag else response
     finally:
         db.close()
 
@@ -92,27 +105,57 @@ async def chat_page(request: Request):
     return templates.TemplateResponse("chat.html", {"request": request})
 
 
-# ---------------- Scheduler: daily 07:00 in DEFAULT_TZ ----------------
+# ---------------- Scheduler: daily 07:00 in each user's timezone ----------------
 scheduler = AsyncIOScheduler()
 
 
-async def daily_job():
-    """Triggers the day planner; same as clicking 'Run Today’s Plan'."""
-    import httpx
-
-    async with httpx.AsyncClient() as client:
-        await client.post("http://127.0.0.1:8000/v1/plan/run")
+def sync_plan_jobs():
+    """Pick up timezones of newly added users (one cron job per timezone)."""
+    planning_scheduler.schedule_buckets(scheduler)
 
 
 @app.on_event("startup")
 def on_start():
+    # Schema changes normally run at deploy time (`python -m app.db.migrate`);
+    # AUTO_MIGRATE=true keeps local dev a one-command start.
+    if settings.auto_migrate:
+        migrate.upgrade()
     if settings.enable_scheduler:
+        sync_plan_jobs()
+        scheduler.add_job(
+            sync_plan_jobs,
+            CronTrigger(minute=30),
+            id="plan:sync-jobs",
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            refresh_expiring_tokens,
+            IntervalTrigger(minutes=5),
+            id="google:refresh-tokens",
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            renew_expiring_channels,
+            IntervalTrigger(hours=1),
+            id="google:renew-channels",
+            replace_existing=True,
+        )
         scheduler.add_job(
-            daily_job, CronTrigger(hour=7, minute=0, timezone=settings.default_tz)
+            extract_inbox,
+            IntervalTrigger(minutes=5),
+            id="inbox:extract",
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
         )
         scheduler.start()
 
 
+@app.on_event("shutdown")
+async def on_stop():
+    await aclose_http()
+
+
 # Optional: quick sanity route for Google creds (remove in prod)
 # @app.get("/debug/google")
 # def debug_google():
@@ -0,0 +1,13 @@
+from sqlalchemy import String, DateTime, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+from app.db.base import Base
+from .common import now_utc
+
+class ActivityRollup(Base):
+    """Latest event start per (user, activity category); see services/activity.py."""
+    __tablename__ = "activity_rollup"
+    user_id: Mapped[str] = mapped_column(ForeignKey("user.id"), primary_key=True)
+    category: Mapped[str] = mapped_column(String, primary_key=True)  # health|relationships|mindfulness|finance
+    last_start: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=now_utc)
@@ -19,6 +19,7 @@ class Event(Base):
     end: Mapped[datetime] = mapped_column(DateTime)
     status: Mapped[str | None] = mapped_column(String, nullable=True)
     raw: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    activity: Mapped[str | None] = mapped_column(String, nullable=True)  # categories tagged at sync, e.g. "health,relationships"
 
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=now_utc)
 
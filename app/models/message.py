@@ -15,3 +15,4 @@ class Message(Base):
     body_hash: Mapped[str | None] = mapped_column(String, nullable=True)
     intent: Mapped[str] = mapped_column(String, default="fyi")  # invite|task|fyi
     data: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    processed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)  # set by inbox extraction
@@ -0,0 +1,13 @@
+from sqlalchemy import Integer, String, DateTime, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+from app.db.base import Base
+from .common import now_utc
+
+class ResourceVersion(Base):
+    """Per-(user, resource) write counter behind the list/dashboard ETags; see services/versions.py."""
+    __tablename__ = "resource_version"
+    user_id: Mapped[str] = mapped_column(ForeignKey("user.id"), primary_key=True)
+    resource: Mapped[str] = mapped_column(String, primary_key=True)  # tasks|goals|stress|plan
+    version: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=now_utc)
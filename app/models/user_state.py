@@ -0,0 +1,20 @@
+from sqlalchemy import DateTime, ForeignKey, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+from app.db.base import Base
+from .common import now_utc
+
+class UserState(Base):
+    """Per-user marker for the derived nudge counters; see services/user_state.py."""
+    __tablename__ = "user_state"
+    user_id: Mapped[str] = mapped_column(ForeignKey("user.id"), primary_key=True)
+    rebuilt_at: Mapped[datetime] = mapped_column(DateTime, default=now_utc)  # last full recount
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=now_utc)
+
+class UserStateCount(Base):
+    """One counter per (user, kind, key), updated with `n = n + delta` so writers never race."""
+    __tablename__ = "user_state_count"
+    user_id: Mapped[str] = mapped_column(ForeignKey("user.id"), primary_key=True)
+    kind: Mapped[str] = mapped_column(String, primary_key=True)  # flag|open_task
+    key: Mapped[str] = mapped_column(String, primary_key=True)   # goal flag or task pillar
+    n: Mapped[int] = mapped_column(Integer, default=0)
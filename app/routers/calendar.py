@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
-from datetime import datetime
-from app.db.session import SessionLocal
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from app.db.session import SessionLocal, ReadSessionLocal
 from app.models.user import User
 from app.models.event import Event
 from app.services.google_calendar import sync_primary, create_event, update_event
 from app.core.config import settings
+from app.db import pagination
+from app.models.calendar_account import CalendarAccount
+from app.services import calendar_watch
+from app.services.plan_cache import plan_cache
+from app.services import freebusy
 
 router = APIRouter(prefix="/v1/calendar", tags=["calendar"])
 
+EVENT_KEYS = [(Event.start, False), (Event.id, False)]
+
 def get_db():
     db = SessionLocal()
     try:
@@ -16,6 +25,13 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 def ensure_user(db: Session) -> User:
     user = db.query(User).first()
     if not user:
@@ -23,33 +39,95 @@ def ensure_user(db: Session) -> User:
         db.add(user); db.commit(); db.refresh(user)
     return user
 
+def read_user(db: Session) -> User:
+    """ensure_user for read-only sessions: look up only, create on the primary if missing."""
+    user = db.query(User).first()
+    if not user:
+        with SessionLocal() as w:
+            user = ensure_user(w)
+            w.expunge(user)
+    return user
+
 @router.post("/sync")
-async def sync(db: Session = Depends(get_db)):
+async def sync(full: bool = Query(False), db: Session = Depends(get_db)):
     user = ensure_user(db)
-    count = sync_primary(db, user, days_forward=30)
-    return {"ok": True, "synced": count}
+    stats = await sync_primary(db, user, days_forward=30, full=full)
+    plan_cache.invalidate_user(user.id)
+    synced = stats["inserted"] + stats["updated"] + stats["unchanged"] + stats["deleted"]
+    return {"ok": True, "synced": synced, "stats": stats}
 
 @router.get("/events")
-async def list_events(frm: str | None = Query(None), to: str | None = Query(None), db: Session = Depends(get_db)):
-    user = ensure_user(db)
+async def list_events(
+    frm: str | None = Query(None),
+    to: str | None = Query(None),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(200, ge=1, le=500),
+    db: Session = Depends(get_read_db),
+):
+    user = read_user(db)
     q = db.query(Event).filter(Event.user_id == user.id)
     if frm:
         q = q.filter(Event.start >= datetime.fromisoformat(frm))
     if to:
         q = q.filter(Event.end <= datetime.fromisoformat(to))
-    events = q.order_by(Event.start.asc()).limit(200).all()
-    return {"ok": True, "data": events}
+    try:
+        events, next_cursor = pagination.paginate(q, EVENT_KEYS, cursor, limit)
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "data": events, "next_cursor": next_cursor}
+
+def _local(iso: str, tz: str) -> datetime:
+    dt = datetime.fromisoformat(iso)
+    return dt.astimezone(ZoneInfo(tz)).replace(tzinfo=None) if dt.tzinfo else dt
+
+@router.get("/freebusy")
+async def free_busy(
+    frm: str | None = Query(None),
+    to: str | None = Query(None),
+    min_minutes: int = Query(30, ge=1),
+    users: str | None = Query(None, description="comma-separated user ids or emails; default: you"),
+    mode: str = Query("all", pattern="^(all|any)$"),
+    work_start: int = Query(9, ge=0, le=24),
+    work_end: int = Query(18, ge=0, le=24),
+    weekends: bool = Query(False),
+    db: Session = Depends(get_read_db),
+):
+    """Free windows of at least `min_minutes` in [frm, to) (default: next 7 days), for one or many users."""
+    user = read_user(db)
+    if users:
+        keys = [k.strip() for k in users.split(",") if k.strip()]
+        rows = db.query(User).filter(User.id.in_(keys) | User.email.in_(keys)).all()
+        if len(rows) < len(keys):
+            return {"ok": False, "error": "Unknown user in 'users'"}
+        user_ids = [u.id for u in rows]
+    else:
+        user_ids = [user.id]
+    start = _local(frm, user.tz) if frm else datetime.now(ZoneInfo(user.tz)).replace(tzinfo=None, second=0, microsecond=0)
+    end = _local(to, user.tz) if to else start + timedelta(days=7)
+    try:
+        res = freebusy.find_free(
+            db, user_ids, start, end,
+            min_minutes=min_minutes,
+            mode=mode,
+            work_hours=(work_start, work_end) if work_end > work_start else None,
+            weekdays=range(7) if weekends else range(5),
+        )
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}
+    windows = [{"start": s.isoformat(), "end": e.isoformat()} for s, e in res["windows"]]
+    return {"ok": True, "data": {"windows": windows, "free_minutes": res["free_minutes"], "busy_minutes": res["busy_minutes"]}}
 
 @router.post("/create")
 async def create(body: dict, db: Session = Depends(get_db)):
     user = ensure_user(db)
-    ev = create_event(
+    ev = await create_event(
         db, user,
         summary=body["summary"],
         start_iso=body["start"],
         end_iso=body["end"],
         location=body.get("location"),
     )
+    plan_cache.invalidate_user(user.id)
     return {"ok": True, "data": {"external_id": ev.external_id}}
 
 @router.post("/update")
@@ -57,5 +135,51 @@ async def patch(body: dict, db: Session = Depends(get_db)):
     user = ensure_user(db)
     external_id = body["external_id"]
     patch = body.get("patch", {})
-    ev = update_event(db, user, external_id, patch)
+    ev = await update_event(db, user, external_id, patch)
+    plan_cache.invalidate_user(user.id)
     return {"ok": True, "data": {"external_id": ev.external_id}}
+
+
+def _account(db: Session, user: User) -> CalendarAccount:
+    acct = (
+        db.query(CalendarAccount)
+        .filter_by(user_id=user.id, provider="google")
+        .one_or_none()
+    )
+    if not acct:
+        raise RuntimeError("No connected Google Calendar account")
+    return acct
+
+
+@router.post("/watch")
+async def watch_start(db: Session = Depends(get_db)):
+    """Subscribe to push notifications for the primary calendar (renewed automatically)."""
+    user = ensure_user(db)
+    watch = await calendar_watch.start_watch(db, _account(db, user))
+    return {"ok": True, "data": {"kind": watch["kind"], "expiration": watch["expiration"]}}
+
+
+@router.delete("/watch")
+async def watch_stop(db: Session = Depends(get_db)):
+    user = ensure_user(db)
+    stopped = await calendar_watch.stop_watch(db, _account(db, user))
+    return {"ok": True, "stopped": stopped}
+
+
+@router.post("/notify")
+async def notify(request: Request, db: Session = Depends(get_db)):
+    """
+    Google push receiver. Always acks fast (unknown channels are ignored);
+    the actual sync is debounced and runs in the background.
+    """
+    calendar_watch.handle_notification(db, request.headers)
+    return Response(status_code=200)
+
+
+@router.post("/watch/ping")
+async def watch_ping(times: int = Query(1, ge=1, le=100), db: Session = Depends(get_db)):
+    """Fire the local stand-in notifier (for offline testing without a public webhook)."""
+    user = ensure_user(db)
+    acct = _account(db, user)
+    acct_id = calendar_watch.local_notifier.push(db, acct, times=times)
+    return {"ok": acct_id is not None, "received": calendar_watch.debouncer.received}
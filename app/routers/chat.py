@@ -1,7 +1,9 @@
+import json
+
 from fastapi import APIRouter
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from app.services.agent_chat import build_agent
+from app.services.agent_chat import agent_pool, turn_stats
 
 router = APIRouter(prefix="/v1/chat", tags=["chat"])
 
@@ -14,11 +16,69 @@ class ChatIn(BaseModel):
 @router.post("/ask")
 async def chat_ask(body: ChatIn):
     try:
-        agent = build_agent(username=body.username)
-        result = await agent.invoke_async(body.message)
+        async with agent_pool.acquire(body.username) as agent:
+            result = await agent.invoke_async(body.message)
         reply = str(result)
 
         # Return in a consistent format for the UI
         return JSONResponse({"ok": True, "markdown": reply})
     except Exception as e:
         return JSONResponse({"ok": False, "markdown": f"**Error:** {e}"})
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def _chat_events(body: ChatIn):
+    """Translate the agent's stream_async events into SSE frames."""
+    announced: set[str] = set()
+    try:
+        async with agent_pool.acquire(body.username) as agent:
+            async for ev in agent.stream_async(body.message):
+                if "data" in ev and ev["data"]:
+                    yield _sse("token", {"text": ev["data"]})
+                elif "current_tool_use" in ev:
+                    tu = ev["current_tool_use"] or {}
+                    tid = tu.get("toolUseId")
+                    if tid and tid not in announced:
+                        announced.add(tid)
+                        yield _sse("tool", {"id": tid, "name": tu.get("name")})
+                elif "message" in ev:
+                    for block in ev["message"].get("content", []):
+                        tr = block.get("toolResult")
+                        if tr:
+                            yield _sse(
+                                "tool_done",
+                                {"id": tr.get("toolUseId"), "status": tr.get("status")},
+                            )
+                elif "result" in ev:
+                    yield _sse("done", {"markdown": str(ev["result"])})
+    except Exception as e:
+        yield _sse("error", {"markdown": f"**Error:** {e}"})
+
+
+@router.post("/stream")
+async def chat_stream(body: ChatIn):
+    """Same as /ask, but streams tokens and tool progress as server-sent events."""
+    return StreamingResponse(
+        _chat_events(body),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class ChatReset(BaseModel):
+    username: str = "Nidhi"
+
+
+@router.post("/reset")
+async def chat_reset(body: ChatReset):
+    """Drop the user's pooled agent so the next message starts a new conversation."""
+    return {"ok": True, "reset": agent_pool.reset(body.username)}
+
+
+@router.get("/stats")
+async def chat_stats():
+    """Pooled agents and per-turn DB usage: queries run vs. reads served from the turn snapshot."""
+    return {"ok": True, "data": {"agents": len(agent_pool), **turn_stats}}
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, ReadSessionLocal
 from app.models.user import User
 from app.models.goal import Goal
 from app.core.config import settings
+from app.db import pagination
+from app.routers.goals_ui import GOAL_KEYS
+from app.services import versions
 
 router = APIRouter(prefix="/v1/goals", tags=["goals"])
 
@@ -16,6 +20,14 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def ensure_user(db: Session) -> User:
     u = db.query(User).first()
     if not u:
@@ -26,15 +38,36 @@ def ensure_user(db: Session) -> User:
     return u
 
 
+def read_user(db: Session) -> User:
+    """ensure_user for read-only sessions: look up only, create on the primary if missing."""
+    u = db.query(User).first()
+    if not u:
+        with SessionLocal() as w:
+            u = ensure_user(w)
+            w.expunge(u)
+    return u
+
+
 @router.get("/list")
-def list_goals(db: Session = Depends(get_db)):
-    u = ensure_user(db)
-    gs = (
-        db.query(Goal)
-        .filter(Goal.user_id == u.id)
-        .order_by(Goal.horizon.asc(), Goal.created_at.asc())
-        .all()
-    )
+def list_goals(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(settings.page_size, ge=1, le=500),
+    db: Session = Depends(get_read_db),
+):
+    u = read_user(db)
+    etag = versions.etag(db, u.id, "goals", "list", cursor, limit)
+    cached = versions.not_modified(request, etag)
+    if cached is not None:
+        return cached
+    try:
+        gs, next_cursor = pagination.paginate(
+            db.query(Goal).filter(Goal.user_id == u.id), GOAL_KEYS, cursor, limit
+        )
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}
+    versions.tagged(response, etag)
     return {
         "ok": True,
         "data": [
@@ -46,4 +79,5 @@ def list_goals(db: Session = Depends(get_db)):
             }
             for g in gs
         ],
+        "next_cursor": next_cursor,
     }
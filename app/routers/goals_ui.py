@@ -1,18 +1,25 @@
 from __future__ import annotations
-from typing import Optional
-from fastapi import APIRouter, Depends, Request
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, ReadSessionLocal
 from app.models.user import User
 from app.models.goal import Goal
 from app.core.config import settings
+from app.db import pagination
+from app.services.plan_cache import plan_cache
+from app.services import versions
+from app.services import user_state
 
 router = APIRouter(tags=["goals"])
 templates = Jinja2Templates(directory="app/templates")
 
+GOAL_KEYS = [(Goal.horizon, False), (Goal.created_at, False), (Goal.id, False)]
+
 
 def get_db():
     db = SessionLocal()
@@ -22,6 +29,14 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def ensure_user(db: Session) -> User:
     u = db.query(User).first()
     if not u:
@@ -32,30 +47,98 @@ def ensure_user(db: Session) -> User:
     return u
 
 
+def read_user(db: Session) -> User:
+    """ensure_user for read-only sessions: look up only, create on the primary if missing."""
+    u = db.query(User).first()
+    if not u:
+        with SessionLocal() as w:
+            u = ensure_user(w)
+            w.expunge(u)
+    return u
+
+
 @router.get("/goals", response_class=HTMLResponse)
 def goals_page(request: Request, db: Session = Depends(get_db)):
     ensure_user(db)
-    goals = db.query(Goal).order_by(Goal.horizon.asc(), Goal.created_at.asc()).all()
-    return templates.TemplateResponse(
-        "goals.html", {"request": request, "goals": goals}
-    )
+    return templates.TemplateResponse("goals.html", {"request": request})
 
 
 @router.get("/v1/goals/fragment", response_class=HTMLResponse)
-def goals_fragment(request: Request, db: Session = Depends(get_db)):
-    ensure_user(db)
-    goals = db.query(Goal).order_by(Goal.horizon.asc(), Goal.created_at.asc()).all()
-    return templates.TemplateResponse(
-        "_goals_table.html", {"request": request, "goals": goals}
+def goals_fragment(
+    request: Request,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(settings.page_size, ge=1, le=500),
+    db: Session = Depends(get_read_db),
+):
+    """The table with its first page, or (with `cursor`) the next page of rows for infinite scroll."""
+    user = read_user(db)
+    etag = versions.etag(db, user.id, "goals", cursor, limit)
+    cached = versions.not_modified(request, etag)
+    if cached is not None:
+        return cached
+    try:
+        goals, next_cursor = pagination.paginate(
+            db.query(Goal).filter(Goal.user_id == user.id), GOAL_KEYS, cursor, limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    ctx: Dict[str, Any] = {
+        "request": request, "goals": goals, "cursor": cursor, "next_cursor": next_cursor, "limit": limit,
+    }
+    if cursor:
+        return versions.tagged(templates.TemplateResponse("_goals_page.html", ctx), etag)
+    ctx["total"] = goal_count(db, user.id)
+    return versions.tagged(templates.TemplateResponse("_goals_table.html", ctx), etag)
+
+
+def goal_count(db: Session, user_id: str) -> int:
+    return db.query(func.count(Goal.id)).filter(Goal.user_id == user_id).scalar()
+
+
+def _next_goal_id(db: Session, g: Goal) -> Optional[str]:
+    """Id of the row that follows `g` in GOAL_KEYS order, or None if `g` sorts last."""
+    return (
+        db.query(Goal.id)
+        .filter(Goal.user_id == g.user_id, pagination.after(GOAL_KEYS, pagination.key_of(g, GOAL_KEYS)))
+        .order_by(*pagination.order_by(GOAL_KEYS))
+        .limit(1)
+        .scalar()
     )
 
 
+def goal_change(
+    request: Request,
+    db: Session,
+    user: User,
+    g: Optional[Goal] = None,
+    moved: bool = False,
+    created: bool = False,
+):
+    """Row-sized response for one goal mutation (see tasks.task_change)."""
+    ctx: Dict[str, Any] = {
+        "request": request,
+        "g": g,
+        "moved": moved,
+        "created": created,
+        "before_id": _next_goal_id(db, g) if g is not None and moved else None,
+        "total": goal_count(db, user.id),
+    }
+    return templates.TemplateResponse("_goal_change.html", ctx)
+
+
+def _blank_to_none(v):
+    # Forms post every cell as a string; an empty target means "no target".
+    return None if v == "" else v
+
+
 class GoalIn(BaseModel):
     horizon: str
     text: str
     metric: Optional[str] = None
     target: Optional[float] = None
 
+    _target = field_validator("target", mode="before")(_blank_to_none)
+
 
 @router.post("/v1/goals", response_class=HTMLResponse)
 def create_goal(req: GoalIn, request: Request, db: Session = Depends(get_db)):
@@ -68,8 +151,11 @@ def create_goal(req: GoalIn, request: Request, db: Session = Depends(get_db)):
         target=req.target,
     )
     db.add(g)
+    user_state.goal_changed(db, user.id, None, user_state.goal_key(g))
+    versions.bump(db, user.id, "goals")
     db.commit()
-    return goals_fragment(request, db)
+    plan_cache.invalidate_user(user.id)
+    return goal_change(request, db, user, g, moved=True, created=True)
 
 
 class GoalPatch(BaseModel):
@@ -78,15 +164,18 @@ class GoalPatch(BaseModel):
     metric: Optional[str] = None
     target: Optional[float] = None
 
+    _target = field_validator("target", mode="before")(_blank_to_none)
+
 
 @router.patch("/v1/goals/{goal_id}", response_class=HTMLResponse)
 def update_goal(
-    goal_id: int, req: GoalPatch, request: Request, db: Session = Depends(get_db)
+    goal_id: str, req: GoalPatch, request: Request, db: Session = Depends(get_db)
 ):
-    ensure_user(db)
+    user = ensure_user(db)
     g = db.get(Goal, goal_id)
     if not g:
-        return goals_fragment(request, db)
+        return goal_change(request, db, user)
+    before = user_state.goal_key(g)
     if req.horizon is not None:
         g.horizon = req.horizon
     if req.text is not None:
@@ -95,15 +184,21 @@ def update_goal(
         g.metric = req.metric
     if req.target is not None:
         g.target = req.target
+    user_state.goal_changed(db, user.id, before, user_state.goal_key(g))
+    versions.bump(db, user.id, "goals")
     db.commit()
-    return goals_fragment(request, db)
+    plan_cache.invalidate_user(user.id)
+    return goal_change(request, db, user, g, moved=g.horizon != before[1])
 
 
 @router.delete("/v1/goals/{goal_id}", response_class=HTMLResponse)
-def delete_goal(goal_id: int, request: Request, db: Session = Depends(get_db)):
-    ensure_user(db)
+def delete_goal(goal_id: str, request: Request, db: Session = Depends(get_db)):
+    user = ensure_user(db)
     g = db.get(Goal, goal_id)
     if g:
         db.delete(g)
+        user_state.goal_changed(db, user.id, user_state.goal_key(g), None)
+        versions.bump(db, user.id, "goals")
         db.commit()
-    return goals_fragment(request, db)
+        plan_cache.invalidate_user(user.id)
+    return goal_change(request, db, user)
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Request, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 from app.db.session import SessionLocal
@@ -28,5 +29,6 @@ async def auth_start(db: Session = Depends(get_db)):
 @router.get("/auth/google/callback")
 async def auth_callback(request: Request, db: Session = Depends(get_db)):
     user = db.query(User).first()
-    acct = finish_oauth(db, user, str(request.url))
+    # Token exchange is a blocking HTTP call; keep it off the event loop.
+    acct = await run_in_threadpool(finish_oauth, db, user, str(request.url))
     return {"ok": True, "connected": True, "provider": "google"}
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends
+import json
+
+from fastapi import APIRouter, Depends, Request
 from sqlalchemy.orm import Session
-import hashlib
 from app.db.session import SessionLocal
+from app.core.config import settings
 from app.models.user import User
 from app.models.message import Message
+from app.services.inbox import ingest_messages, message_hash
+from app.services import intent
+from app.services.extraction import process_user
 
 router = APIRouter(prefix="/v1/inbox", tags=["inbox"])
 
@@ -14,20 +19,76 @@ def get_db():
     finally:
         db.close()
 
-def quick_intent(subject: str | None, body: str | None):
-    text = f"{subject or ''} {body or ''}".lower()
-    if any(k in text for k in ["dinner","lunch","meet","coffee","tomorrow","tonight"]): return "invite"
-    if any(k in text for k in ["todo","task","please do","action"]): return "task"
-    return "fyi"
-
 @router.post("/webhook")
 async def inbox_webhook(payload: dict, db: Session = Depends(get_db)):
     user = db.query(User).first()
     if not user: return {"ok": False, "error": "No user"}
-    subject = payload.get("subject"); body = payload.get("body")
-    body_hash = hashlib.sha256((body or "").encode()).hexdigest()
-    intent = quick_intent(subject, body)
-    msg = Message(user_id=user.id, channel=payload.get("channel","email"), from_addr=payload.get("from"),
-                  subject=subject, body_hash=body_hash, intent=intent, data=payload)
-    db.add(msg); db.commit()
-    return {"ok": True, "data": {"id": msg.id, "intent": intent}}
+    stats = ingest_messages(db, user.id, [payload])
+    body_hash = message_hash(payload)
+    msg = db.query(Message).filter_by(user_id=user.id, body_hash=body_hash).one()
+    return {"ok": True, "data": {"id": msg.id, "intent": msg.intent, "duplicate": stats["accepted"] == 0}}
+
+def _ndjson(raw: bytes) -> list:
+    return [json.loads(line) for line in raw.splitlines() if line.strip()]
+
+def _batch_payloads(raw: bytes, content_type: str) -> list:
+    """Messages from a JSON array, {"messages": [...]}, one message object, or NDJSON."""
+    if "ndjson" in content_type or not raw.lstrip()[:1] in (b"[", b"{"):
+        return _ndjson(raw)
+    try:
+        doc = json.loads(raw)
+    except json.JSONDecodeError as e:
+        # NDJSON posted without an ndjson content type: the first line parses, then "Extra data".
+        if not e.msg.startswith("Extra data"):
+            raise
+        return _ndjson(raw)
+    if isinstance(doc, dict):
+        doc = doc["messages"] if "messages" in doc else [doc]
+    if not isinstance(doc, list):
+        raise ValueError('"messages" must be a JSON array')
+    return doc
+
+@router.post("/batch")
+async def inbox_batch(request: Request, db: Session = Depends(get_db)):
+    """
+    Bulk ingest: a JSON array, {"messages": [...]}, a single message object, or
+    NDJSON (one message per line). Replays are idempotent: duplicates on
+    (user, body hash) are skipped and counted.
+    """
+    user = db.query(User).first()
+    if not user: return {"ok": False, "error": "No user"}
+    raw = await request.body()
+    try:
+        payloads = _batch_payloads(raw, request.headers.get("content-type", ""))
+    except ValueError as e:
+        return {"ok": False, "error": f"Invalid JSON: {e}"}
+    if not payloads:
+        return {"ok": False, "error": "No messages in request body"}
+    if not all(isinstance(p, dict) for p in payloads):
+        return {"ok": False, "error": "Each message must be a JSON object"}
+    return {"ok": True, "data": ingest_messages(db, user.id, payloads)}
+
+@router.post("/classify")
+async def inbox_classify(payload: dict, db: Session = Depends(get_db)):
+    """Dry-run the intent classifier: intent, per-intent scores and matched spans."""
+    user = db.query(User).first()
+    res = intent.classify(
+        payload.get("subject"), payload.get("body"), db,
+        user.id if user else None, payload.get("channel", "email"),
+    )
+    return {"ok": True, "data": res.as_dict()}
+
+@router.post("/extract")
+async def inbox_extract(db: Session = Depends(get_db)):
+    """Run the extraction stage now: pending invite/task messages -> tasks and invite decisions."""
+    user = db.query(User).first()
+    if not user: return {"ok": False, "error": "No user"}
+    if not settings.anthropic_key:
+        return {"ok": False, "error": "ANTHROPIC_API_KEY is not set; messages stay pending"}
+    try:
+        stats = await process_user(db, user)
+    except Exception as e:
+        # Batches committed before the failure stay applied; the failing one is retried next run.
+        db.rollback()
+        return {"ok": False, "error": f"Extraction failed: {e}"}
+    return {"ok": True, "data": stats}
@@ -1,17 +1,27 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from app.db.session import ReadSessionLocal
+from app.core.config import settings
+from app.models.user import User
 from app.schemas.invite import InviteDecisionIn
-from app.services.decision import score_decision
+from app.services.decision import decide_invite
 
 router = APIRouter(prefix="/v1/invite", tags=["invite"])
 
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 @router.post("/decide")
-async def decide(inv: InviteDecisionIn):
-    schedule_cost = min(1.0, inv.conflicts*0.5 + inv.travelTime/90)
-    s = score_decision(relationship_value=0.8, wellbeing_delta=0.2, goal_disruption=0.6, schedule_cost=schedule_cost)
-    accept = s > 0.1
-    tradeoffs = ["Shift strength to 18:00", "Shorten deep work by 30m"] if accept else ["Keep existing workout & deep work intact"]
-    alternatives = [
-        {"when": "Wed 19:30", "reason": "no conflicts"},
-        {"when": "Thu 19:00", "reason": "keeps Health needle"},
-    ]
-    return {"ok": True, "data": {"accept": accept, "tradeoffs": tradeoffs, "alternatives": alternatives}}
+async def decide(inv: InviteDecisionIn, db: Session = Depends(get_read_db)):
+    user = db.query(User).first()
+    if not user:
+        user = User(id="", tz=settings.default_tz)  # no data yet: everything is free
+    try:
+        data = decide_invite(db, user, inv.when, duration_min=inv.durationMin, travel_min=inv.travelTime)
+    except (ValueError, OverflowError):
+        return {"ok": False, "error": f"Could not understand when={inv.when!r}"}
+    return {"ok": True, "data": data}
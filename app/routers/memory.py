@@ -2,6 +2,9 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from app.db.session import SessionLocal
 from app.services.memory import upsert_preference
+from app.services.plan_cache import plan_cache
+from app.services import versions
+from app.services import intent
 from app.models.user import User
 from app.models.trait import Trait
 from app.models.stressor import Stressor
@@ -22,10 +25,12 @@ async def upsert(body: dict, db: Session = Depends(get_db)):
     kind = body.get("kind"); key = body.get("key")
     value = body.get("value"); conf = float(body.get("confidence", 0.8))
     if kind == "preference":
-        upsert_preference(db, user.id, key, value, conf); db.commit(); return {"ok": True}
+        upsert_preference(db, user.id, key, value, conf); db.commit()
+        if key == intent.RULES_KEY: intent.classifiers.invalidate(user.id)
+        return {"ok": True}
     if kind == "trait":
         t = Trait(user_id=user.id, key=key, value=value, confidence=conf); db.add(t); db.commit(); return {"ok": True}
     if kind == "stressor":
         s = Stressor(user_id=user.id, trigger=key, pattern=value.get("pattern"), coping=value.get("coping"), confidence=conf)
-        db.add(s); db.commit(); return {"ok": True}
+        db.add(s); versions.bump(db, user.id, "stress"); db.commit(); plan_cache.invalidate_user(user.id); return {"ok": True}
     return {"ok": False, "error": "Unknown kind"}
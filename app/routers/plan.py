@@ -1,13 +1,14 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Query, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 
 from app.db.session import SessionLocal
 from app.core.config import settings
-from app.core.time import day_bounds
 from app.models.user import User
-from app.models.plan import Plan
+from app.services.planner import save_plan, plan_stats
+from app.services.llm import llm_usage
+from app.services import scheduler as planning_scheduler
 
 # Reuse the SAME tools the chat agent uses
 from app.services.agent_chat import (
@@ -39,8 +40,11 @@ def ensure_user(db: Session) -> User:
     return u
 
 
+ENGINE_QUERY = Query(None, pattern="^(local|llm|hybrid)$")
+
+
 @router.post("/run")
-async def run_plan(db: Session = Depends(get_db)):
+async def run_plan(engine: str | None = ENGINE_QUERY, db: Session = Depends(get_db)):
     """
     Build & SAVE today's plan using the same tools the chat uses.
     """
@@ -48,49 +52,24 @@ async def run_plan(db: Session = Depends(get_db)):
 
     # Same pipeline your chat calls
     _summary = tool_goal_summary()  # not saved; handy for UI toast if needed
-    payload = await tool_plan_today()  # dict with eisenhower/schedule/etc.
+    payload = await tool_plan_today(engine=engine)  # dict with eisenhower/schedule/etc.
     suggestions = tool_suggest_next_actions()  # extra nudges
 
     # Upsert today's saved plan
-    start, end = day_bounds(user.tz)
-    plan = (
-        db.query(Plan)
-        .filter(Plan.user_id == user.id, Plan.date >= start, Plan.date <= end)
-        .one_or_none()
-    )
-    if not plan:
-        plan = Plan(
-            user_id=user.id,
-            date=start,
-            matrix=payload["eisenhower"],
-            schedule=payload["schedule"],
-            affirmations=payload.get("affirmations", {}),
-            needles=payload.get("three_needles", {}),
-            stress_guide=payload.get("stress_guide", []),
-            nudges=(payload.get("nudges", []) + suggestions.get("advice", [])),
-        )
-        db.add(plan)
-    else:
-        plan.matrix = payload["eisenhower"]
-        plan.schedule = payload["schedule"]
-        plan.affirmations = payload.get("affirmations", {})
-        plan.needles = payload.get("three_needles", {})
-        plan.stress_guide = payload.get("stress_guide", [])
-        plan.nudges = payload.get("nudges", []) + suggestions.get("advice", [])
-
-    db.commit()
-    db.refresh(plan)
+    plan = save_plan(db, user, payload, suggestions.get("advice", []))
     return {"ok": True, "planId": plan.id, "goalsSummary": _summary}
 
 
 @router.get("/fragment", response_class=HTMLResponse)
-async def plan_fragment(request: Request, db: Session = Depends(get_db)):
+async def plan_fragment(
+    request: Request, engine: str | None = ENGINE_QUERY, db: Session = Depends(get_db)
+):
     """
     Build today's plan LIVE (same tools), but DO NOT save.
     Returns the rendered HTML partial so the homepage can swap it in without reload.
     """
     ensure_user(db)  # ensures tz etc.
-    payload = await tool_plan_today()
+    payload = await tool_plan_today(engine=engine)
     suggestions = tool_suggest_next_actions()
 
     # Build a "view model" (same shape the partials expect)
@@ -108,3 +87,26 @@ async def plan_fragment(request: Request, db: Session = Depends(get_db)):
         "_plan_container.html",
         {"request": request, "plan": view_plan},
     )
+
+
+@router.get("/runs")
+def plan_runs():
+    """Throughput/latency stats for recent scheduled planning runs, plus the tz buckets."""
+    return {
+        "ok": True,
+        "data": {
+            "buckets": planning_scheduler.timezone_buckets(),
+            "runs": list(planning_scheduler.recent_runs),
+        },
+    }
+
+
+@router.get("/usage")
+def plan_usage():
+    """Prompt/cached/output token counts for recent planner LLM calls, totals, and parse/repair/fallback counts."""
+    calls = list(llm_usage)
+    totals = {
+        k: sum(c[k] for c in calls)
+        for k in ("promptTokens", "cachedTokens", "cacheWriteTokens", "outputTokens")
+    }
+    return {"ok": True, "data": {"totals": {"calls": len(calls), **totals}, "outcomes": dict(plan_stats), "calls": calls}}
@@ -1,17 +1,24 @@
 from __future__ import annotations
-from fastapi import APIRouter, Depends, Request
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, ReadSessionLocal
 from app.models.user import User
 from app.models.stressor import Stressor
 from app.core.config import settings
+from app.db import pagination
+from app.services.plan_cache import plan_cache
+from app.services import versions
 
 router = APIRouter(tags=["stress"])
 templates = Jinja2Templates(directory="app/templates")
 
+STRESS_KEYS = [(Stressor.id, False)]
+
 
 def get_db():
     db = SessionLocal()
@@ -21,6 +28,14 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def ensure_user(db: Session) -> User:
     u = db.query(User).first()
     if not u:
@@ -31,22 +46,81 @@ def ensure_user(db: Session) -> User:
     return u
 
 
+def read_user(db: Session) -> User:
+    """ensure_user for read-only sessions: look up only, create on the primary if missing."""
+    u = db.query(User).first()
+    if not u:
+        with SessionLocal() as w:
+            u = ensure_user(w)
+            w.expunge(u)
+    return u
+
+
 @router.get("/stress", response_class=HTMLResponse)
 def stress_page(request: Request, db: Session = Depends(get_db)):
     ensure_user(db)
-    items = db.query(Stressor).order_by(Stressor.id.asc()).all()
-    return templates.TemplateResponse(
-        "stress.html", {"request": request, "items": items}
-    )
+    return templates.TemplateResponse("stress.html", {"request": request})
 
 
 @router.get("/v1/stress/fragment", response_class=HTMLResponse)
-def stress_fragment(request: Request, db: Session = Depends(get_db)):
-    ensure_user(db)
-    items = db.query(Stressor).order_by(Stressor.id.asc()).all()
-    return templates.TemplateResponse(
-        "_stress_table.html", {"request": request, "items": items}
-    )
+def stress_fragment(
+    request: Request,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(settings.page_size, ge=1, le=500),
+    db: Session = Depends(get_read_db),
+):
+    """The table with its first page, or (with `cursor`) the next page of rows for infinite scroll."""
+    user = read_user(db)
+    etag = versions.etag(db, user.id, "stress", cursor, limit)
+    cached = versions.not_modified(request, etag)
+    if cached is not None:
+        return cached
+    try:
+        items, next_cursor = pagination.paginate(
+            db.query(Stressor).filter(Stressor.user_id == user.id), STRESS_KEYS, cursor, limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    ctx: Dict[str, Any] = {
+        "request": request, "items": items, "cursor": cursor, "next_cursor": next_cursor, "limit": limit,
+    }
+    if cursor:
+        return versions.tagged(templates.TemplateResponse("_stress_page.html", ctx), etag)
+    ctx["total"] = stress_count(db, user.id)
+    return versions.tagged(templates.TemplateResponse("_stress_table.html", ctx), etag)
+
+
+def stress_count(db: Session, user_id: str) -> int:
+    return db.query(func.count(Stressor.id)).filter(Stressor.user_id == user_id).scalar()
+
+
+def stress_change(
+    request: Request,
+    db: Session,
+    user: User,
+    s: Optional[Stressor] = None,
+    created: bool = False,
+):
+    """Row-sized response for one stressor mutation (see tasks.task_change).
+    Rows are ordered by id, which never changes, so only inserts are placed."""
+    before_id = None
+    if s is not None and created:
+        before_id = (
+            db.query(Stressor.id)
+            .filter(Stressor.user_id == user.id, pagination.after(STRESS_KEYS, [s.id]))
+            .order_by(Stressor.id.asc())
+            .limit(1)
+            .scalar()
+        )
+    ctx: Dict[str, Any] = {
+        "request": request,
+        "s": s,
+        "moved": created,
+        "created": created,
+        "before_id": before_id,
+        "total": stress_count(db, user.id),
+    }
+    return templates.TemplateResponse("_stress_change.html", ctx)
 
 
 class StressIn(BaseModel):
@@ -58,13 +132,14 @@ class StressIn(BaseModel):
 @router.post("/v1/stress", response_class=HTMLResponse)
 def create_stress(req: StressIn, request: Request, db: Session = Depends(get_db)):
     user = ensure_user(db)
-    db.add(
-        Stressor(
-            user_id=user.id, trigger=req.trigger, pattern=req.pattern, coping=req.coping
-        )
+    s = Stressor(
+        user_id=user.id, trigger=req.trigger, pattern=req.pattern, coping=req.coping
     )
+    db.add(s)
+    versions.bump(db, user.id, "stress")
     db.commit()
-    return stress_fragment(request, db)
+    plan_cache.invalidate_user(user.id)
+    return stress_change(request, db, user, s, created=True)
 
 
 class StressPatch(BaseModel):
@@ -75,27 +150,31 @@ class StressPatch(BaseModel):
 
 @router.patch("/v1/stress/{sid}", response_class=HTMLResponse)
 def update_stress(
-    sid: int, req: StressPatch, request: Request, db: Session = Depends(get_db)
+    sid: str, req: StressPatch, request: Request, db: Session = Depends(get_db)
 ):
-    ensure_user(db)
+    user = ensure_user(db)
     s = db.get(Stressor, sid)
     if not s:
-        return stress_fragment(request, db)
+        return stress_change(request, db, user)
     if req.trigger is not None:
         s.trigger = req.trigger
     if req.pattern is not None:
         s.pattern = req.pattern
     if req.coping is not None:
         s.coping = req.coping
+    versions.bump(db, user.id, "stress")
     db.commit()
-    return stress_fragment(request, db)
+    plan_cache.invalidate_user(user.id)
+    return stress_change(request, db, user, s)
 
 
 @router.delete("/v1/stress/{sid}", response_class=HTMLResponse)
-def delete_stress(sid: int, request: Request, db: Session = Depends(get_db)):
-    ensure_user(db)
+def delete_stress(sid: str, request: Request, db: Session = Depends(get_db)):
+    user = ensure_user(db)
     s = db.get(Stressor, sid)
     if s:
         db.delete(s)
+        versions.bump(db, user.id, "stress")
         db.commit()
-    return stress_fragment(request, db)
+        plan_cache.invalidate_user(user.id)
+    return stress_change(request, db, user)
@@ -1,19 +1,27 @@
 from __future__ import annotations
 from datetime import datetime
-from typing import Optional
-from fastapi import APIRouter, Depends, Request
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, ReadSessionLocal
 from app.models.user import User
 from app.models.task import Task
 from app.core.config import settings
+from app.db import pagination
+from app.services.plan_cache import plan_cache
+from app.services import versions
+from app.services import user_state
 
 router = APIRouter(tags=["tasks"])
 templates = Jinja2Templates(directory="app/templates")
 
+# Listing order, ending in a unique key so it can be paginated by cursor.
+TASK_KEYS = [(Task.status, False), (Task.impact, True), (Task.id, False)]
+
 
 def get_db():
     db = SessionLocal()
@@ -23,6 +31,14 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def ensure_user(db: Session) -> User:
     u = db.query(User).first()
     if not u:
@@ -33,22 +49,104 @@ def ensure_user(db: Session) -> User:
     return u
 
 
+def read_user(db: Session) -> User:
+    """ensure_user for read-only sessions: look up only, create on the primary if missing."""
+    u = db.query(User).first()
+    if not u:
+        with SessionLocal() as w:
+            u = ensure_user(w)
+            w.expunge(u)
+    return u
+
+
 @router.get("/tasks", response_class=HTMLResponse)
 def tasks_page(request: Request, db: Session = Depends(get_db)):
     ensure_user(db)
-    tasks = db.query(Task).order_by(Task.status.asc(), Task.impact.desc()).all()
-    return templates.TemplateResponse(
-        "tasks.html", {"request": request, "tasks": tasks}
-    )
+    # Rows are loaded page by page by the fragment below.
+    return templates.TemplateResponse("tasks.html", {"request": request})
 
 
 @router.get("/v1/tasks/fragment", response_class=HTMLResponse)
-def tasks_fragment(request: Request, db: Session = Depends(get_db)):
-    ensure_user(db)
-    tasks = db.query(Task).order_by(Task.status.asc(), Task.impact.desc()).all()
-    return templates.TemplateResponse(
-        "_tasks_table.html", {"request": request, "tasks": tasks}
+def tasks_fragment(
+    request: Request,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(settings.page_size, ge=1, le=500),
+    db: Session = Depends(get_read_db),
+):
+    """The table with its first page, or (with `cursor`) the next page of rows for infinite scroll."""
+    user = read_user(db)
+    # Unchanged since the client's copy: answer before touching any rows.
+    etag = versions.etag(db, user.id, "tasks", cursor, limit)
+    cached = versions.not_modified(request, etag)
+    if cached is not None:
+        return cached
+    try:
+        tasks, next_cursor = pagination.paginate(
+            db.query(Task).filter(Task.user_id == user.id), TASK_KEYS, cursor, limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    ctx: Dict[str, Any] = {
+        "request": request, "tasks": tasks, "cursor": cursor, "next_cursor": next_cursor, "limit": limit,
+    }
+    if cursor:
+        return versions.tagged(templates.TemplateResponse("_tasks_page.html", ctx), etag)
+    ctx["counts"] = task_counts(db, user.id)
+    return versions.tagged(templates.TemplateResponse("_tasks_table.html", ctx), etag)
+
+
+def task_counts(db: Session, user_id: str) -> Dict[str, int]:
+    by_status = dict(
+        db.query(Task.status, func.count())
+        .filter(Task.user_id == user_id)
+        .group_by(Task.status)
+        .all()
     )
+    return {
+        "open": by_status.get("open", 0),
+        "done": by_status.get("done", 0),
+        "total": sum(by_status.values()),
+    }
+
+
+def _next_task_id(db: Session, t: Task) -> Optional[str]:
+    """Id of the row that follows `t` in TASK_KEYS order, or None if `t` sorts last."""
+    return (
+        db.query(Task.id)
+        .filter(Task.user_id == t.user_id, pagination.after(TASK_KEYS, pagination.key_of(t, TASK_KEYS)))
+        .order_by(*pagination.order_by(TASK_KEYS))
+        .limit(1)
+        .scalar()
+    )
+
+
+def task_change(
+    request: Request,
+    db: Session,
+    user: User,
+    t: Optional[Task] = None,
+    moved: bool = False,
+    created: bool = False,
+):
+    """
+    Render one mutation as a row-sized response: the row itself (swapped into
+    `closest tr`), or, when its sort position changed, an out-of-band insert
+    before its new neighbour. The counter is always refreshed out of band.
+    If that neighbour (or, for the last row, the end of the table) has not been
+    scrolled into the page yet, the insert finds no target and the row simply
+    arrives with a later page.
+    """
+    counts = task_counts(db, user.id)
+    ctx: Dict[str, Any] = {
+        "request": request,
+        "t": t,
+        "moved": moved,
+        "created": created,
+        "before_id": _next_task_id(db, t) if t is not None and moved else None,
+        "counts": counts,
+        "total": counts["total"],
+    }
+    return templates.TemplateResponse("_task_change.html", ctx)
 
 
 class TaskIn(BaseModel):
@@ -67,17 +165,19 @@ def create_task(req: TaskIn, request: Request, db: Session = Depends(get_db)):
             due = datetime.fromisoformat(req.dueAt.replace("Z", ""))
         except Exception:
             due = None
-    db.add(
-        Task(
-            user_id=user.id,
-            title=req.title,
-            pillar=req.pillar,
-            impact=int(req.impact),
-            due_at=due,
-        )
+    t = Task(
+        user_id=user.id,
+        title=req.title,
+        pillar=req.pillar,
+        impact=int(req.impact),
+        due_at=due,
     )
+    db.add(t)
+    user_state.task_changed(db, user.id, None, (t.pillar, "open"))
+    versions.bump(db, user.id, "tasks")
     db.commit()
-    return tasks_fragment(request, db)
+    plan_cache.invalidate_user(user.id)
+    return task_change(request, db, user, t, moved=True, created=True)
 
 
 class TaskPatch(BaseModel):
@@ -86,15 +186,23 @@ class TaskPatch(BaseModel):
     impact: Optional[int] = None
     dueAt: Optional[str] = None
 
+    @field_validator("impact", mode="before")
+    @classmethod
+    def _blank_impact(cls, v):
+        # Row edits post every cell as a string; an emptied cell means "unchanged".
+        return None if v == "" else v
+
 
 @router.patch("/v1/tasks/{task_id}", response_class=HTMLResponse)
 def update_task(
-    task_id: int, req: TaskPatch, request: Request, db: Session = Depends(get_db)
+    task_id: str, req: TaskPatch, request: Request, db: Session = Depends(get_db)
 ):
-    ensure_user(db)
+    user = ensure_user(db)
     t = db.get(Task, task_id)
     if not t:
-        return tasks_fragment(request, db)
+        return task_change(request, db, user)
+    before = user_state.task_key(t)
+    order_before = (t.status, t.impact)
     if req.title is not None:
         t.title = req.title
     if req.pillar is not None:
@@ -110,25 +218,36 @@ def update_task(
             )
         except Exception:
             t.due_at = None
+    user_state.task_changed(db, user.id, before, user_state.task_key(t))
+    versions.bump(db, user.id, "tasks")
     db.commit()
-    return tasks_fragment(request, db)
+    plan_cache.invalidate_user(user.id)
+    return task_change(request, db, user, t, moved=(t.status, t.impact) != order_before)
 
 
 @router.post("/v1/tasks/{task_id}/toggle", response_class=HTMLResponse)
-def toggle_task(task_id: int, request: Request, db: Session = Depends(get_db)):
-    ensure_user(db)
+def toggle_task(task_id: str, request: Request, db: Session = Depends(get_db)):
+    user = ensure_user(db)
     t = db.get(Task, task_id)
-    if t:
-        t.status = "done" if t.status != "done" else "open"
-        db.commit()
-    return tasks_fragment(request, db)
+    if not t:
+        return task_change(request, db, user)
+    before = user_state.task_key(t)
+    t.status = "done" if t.status != "done" else "open"
+    user_state.task_changed(db, user.id, before, user_state.task_key(t))
+    versions.bump(db, user.id, "tasks")
+    db.commit()
+    plan_cache.invalidate_user(user.id)
+    return task_change(request, db, user, t, moved=True)
 
 
 @router.delete("/v1/tasks/{task_id}", response_class=HTMLResponse)
-def delete_task(task_id: int, request: Request, db: Session = Depends(get_db)):
-    ensure_user(db)
+def delete_task(task_id: str, request: Request, db: Session = Depends(get_db)):
+    user = ensure_user(db)
     t = db.get(Task, task_id)
     if t:
         db.delete(t)
+        user_state.task_changed(db, user.id, user_state.task_key(t), None)
+        versions.bump(db, user.id, "tasks")
         db.commit()
-    return tasks_fragment(request, db)
+        plan_cache.invalidate_user(user.id)
+    return task_change(request, db, user)
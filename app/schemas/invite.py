@@ -5,5 +5,7 @@ class InviteDecisionIn(BaseModel):
     when: str
     who: Optional[str] = None
     location: Optional[str] = None
+    durationMin: int = 60
+    # Deprecated: conflicts are now detected from the user's calendar.
     conflicts: int = 0
     travelTime: int = 0
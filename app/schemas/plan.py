@@ -23,3 +23,7 @@ class PlanPayload(BaseModel):
     affirmations: Dict[str, str]
     stress_guide: List[StressRule]
     nudges: List[dict]
+
+class PlanProse(BaseModel):
+    affirmations: Dict[str, str]
+    three_needles: Dict[str, str]
@@ -0,0 +1,90 @@
+"""
+Activity categories for calendar events and the per-user "last activity" rollup.
+
+Events are tagged once when they are written: `event.activity` holds every
+matching category, comma-joined in CATEGORIES order ("Lunch run with friends"
+-> "health,relationships"). `activity_rollup` keeps the latest start per
+(user, category), counting an event under each of its categories. Cadence
+checks are then a primary-key lookup instead of a REGEXP scan over every
+event, and work on any backend.
+"""
+import re
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.activity import ActivityRollup
+from app.models.event import Event
+
+# Order is the order of the categories inside a tag.
+CATEGORIES: Dict[str, tuple] = {
+    "health": ("exercise", "workout", "run", "running", "walk", "yoga", "skipping", "skip",
+               "skips", "gym", "strength", "swim", "hike", "bike", "pilates"),
+    "mindfulness": ("meditation", "meditate", "breathing", "journal", "journaling"),
+    "relationships": ("dinner", "lunch", "brunch", "coffee", "meet", "hangout", "call", "parents",
+                      "mom", "dad", "friend", "friends", "husband", "wife", "partner", "date"),
+    "finance": ("invest", "investing", "budget", "taxes", "finance", "bank", "vti"),
+}
+
+_PATTERN = re.compile(
+    r"(?<!\w)(?:"
+    + "|".join(
+        f"(?P<{cat}>{'|'.join(map(re.escape, sorted(kws, key=len, reverse=True)))})"
+        for cat, kws in CATEGORIES.items()
+    )
+    + r")(?!\w)",
+    re.IGNORECASE,
+)
+
+
+def categorize(summary: Optional[str]) -> Optional[str]:
+    """Every category the summary matches, as one tag ("health,relationships"), or None."""
+    if not summary:
+        return None
+    found = {m.lastgroup for m in _PATTERN.finditer(summary)}
+    return ",".join(cat for cat in CATEGORIES if cat in found) or None
+
+
+def categories(tag: Optional[str]) -> List[str]:
+    """The categories inside an `event.activity` tag."""
+    return tag.split(",") if tag else []
+
+
+def refresh_rollup(db: Session, user_id: str, cats: Iterable[str] | None = None) -> None:
+    """Recompute last_start for the given categories (default: all) with one
+    grouped MAX per distinct tag over the (user_id, activity, start) index;
+    an event counts for every category in its tag. Does not commit."""
+    db.flush()
+    now = datetime.utcnow()
+    latest: Dict[str, Optional[datetime]] = {cat: None for cat in cats or CATEGORIES}
+    rows = (
+        db.query(Event.activity, func.max(Event.start))
+        .filter(Event.user_id == user_id, Event.activity.isnot(None))
+        .group_by(Event.activity)
+    )
+    for tag, last in rows:
+        for cat in categories(tag):
+            if cat in latest and (latest[cat] is None or last > latest[cat]):
+                latest[cat] = last
+    for cat, last in latest.items():
+        row = db.get(ActivityRollup, (user_id, cat))
+        if row is None:
+            db.add(ActivityRollup(user_id=user_id, category=cat, last_start=last, updated_at=now))
+        elif row.last_start != last:
+            row.last_start = last
+            row.updated_at = now
+
+
+def last_activity(db: Session, user_id: str, category: str) -> Optional[datetime]:
+    row = db.get(ActivityRollup, (user_id, category))
+    return row.last_start if row else None
+
+
+def days_since(db: Session, user_id: str, category: str, now: datetime | None = None) -> Optional[int]:
+    """Whole days since the latest event in `category` (negative if the latest is upcoming)."""
+    last = last_activity(db, user_id, category)
+    if last is None:
+        return None
+    return ((now or datetime.utcnow()) - last.replace(tzinfo=None)).days
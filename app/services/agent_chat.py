@@ -1,9 +1,16 @@
 import os
-from typing import Any, Dict, List, Optional
+import asyncio
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 
+from sqlalchemy import event
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from strands import Agent, tool
 from strands.models.anthropic import (
     AnthropicModel,
@@ -15,17 +22,15 @@ from app.models.user import User
 from app.models.task import Task
 from app.models.goal import Goal
 from app.models.stressor import Stressor
-from app.services.memory import upsert_preference
-from app.core.time import day_bounds
 from app.models.event import Event
-from app.services.planner import call_claude
+from app.services.memory import upsert_preference
+from app.services.planner import context_from_rows, open_tasks, plan_for_user, today_events
+from app.services.plan_cache import plan_cache
+from app.services import versions
+from app.services import freebusy, user_state
 
 
 # ---------- db helpers ----------
-def _db() -> Session:
-    return SessionLocal()
-
-
 def _ensure_user(db: Session) -> User:
     u = db.query(User).first()
     if not u:
@@ -36,6 +41,108 @@ def _ensure_user(db: Session) -> User:
     return u
 
 
+# Across all turns: turns, queries (ORM statements run), saved (memoized reads
+# served without a query), open (turns not yet closed; should hover near 0).
+turn_stats: Counter = Counter()
+
+
+class ToolTurn:
+    """
+    One chat turn's DB session, shared by every tool the agent calls in it.
+    User, goals, open tasks, stressors and today's events are loaded on first
+    use and memoized; writes call `forget` for what they touched. Tools may run
+    concurrently (sync ones in worker threads), so access goes through `lock`.
+    """
+
+    def __init__(self) -> None:
+        self.db = SessionLocal(expire_on_commit=False)
+        self.lock = threading.RLock()
+        self.queries = 0
+        self.saved = 0
+        self._memo: Dict[str, Any] = {}
+        event.listen(self.db, "do_orm_execute", self._count)
+        turn_stats["open"] += 1
+
+    def _count(self, _state) -> None:
+        self.queries += 1
+
+    def _load(self, key: str, fn):
+        if key in self._memo:
+            self.saved += 1
+            return self._memo[key]
+        value = self._memo[key] = fn()
+        return value
+
+    def forget(self, *keys: str) -> None:
+        for k in keys:
+            self._memo.pop(k, None)
+
+    @property
+    def user(self) -> User:
+        return self._load("user", lambda: _ensure_user(self.db))
+
+    def goals(self) -> List[Goal]:
+        return self._load(
+            "goals",
+            lambda: self.db.query(Goal)
+            .filter(Goal.user_id == self.user.id)
+            .order_by(Goal.horizon.asc(), Goal.created_at.asc())
+            .all(),
+        )
+
+    def tasks(self) -> List[Task]:
+        return self._load("tasks", lambda: open_tasks(self.db, self.user.id))
+
+    def stressors(self) -> List[Stressor]:
+        return self._load(
+            "stressors",
+            lambda: self.db.query(Stressor).filter(Stressor.user_id == self.user.id).all(),
+        )
+
+    def events(self) -> List[Event]:
+        return self._load("events", lambda: today_events(self.db, self.user))
+
+    def planner_context(self) -> Dict[str, Any]:
+        return context_from_rows(self.user, self.tasks(), self.goals(), self.stressors(), self.events())
+
+    def close(self) -> None:
+        self.db.close()
+        turn_stats["open"] -= 1
+        turn_stats["turns"] += 1
+        turn_stats["queries"] += self.queries
+        turn_stats["saved"] += self.saved
+
+
+_current_turn: ContextVar[Optional[ToolTurn]] = ContextVar("agent_turn", default=None)
+
+
+@contextmanager
+def open_turn() -> Iterator[ToolTurn]:
+    """Bind a fresh ToolTurn for the duration of one agent invocation; always closes it."""
+    t = ToolTurn()
+    token = _current_turn.set(t)
+    try:
+        yield t
+    finally:
+        try:
+            _current_turn.reset(token)
+        except ValueError:  # exited from a different context (e.g. a streamed response)
+            _current_turn.set(None)
+        t.close()
+
+
+@contextmanager
+def _turn() -> Iterator[ToolTurn]:
+    """The current turn (locked), or a one-off turn when a tool is called outside the agent."""
+    t = _current_turn.get()
+    if t is not None:
+        with t.lock:
+            yield t
+        return
+    with open_turn() as t, t.lock:
+        yield t
+
+
 # ---------- GOAL tools ----------
 @tool
 def upsert_goal(
@@ -47,63 +154,57 @@ def upsert_goal(
     """
     Save or update a goal. 'horizon' can be 'short' or 'long' (also accepts 14d|90d|12m).
     """
-    db = _db()
-    user = _ensure_user(db)
-    # naive de-dup: same text + horizon -> update; else insert
-    g = (
-        db.query(Goal)
-        .filter(Goal.user_id == user.id, Goal.text == text, Goal.horizon == horizon)
-        .one_or_none()
-    )
-    if not g:
-        g = Goal(
-            user_id=user.id, horizon=horizon, text=text, metric=metric, target=target
-        )
-        db.add(g)
-    else:
-        g.metric = metric
-        g.target = target
-    db.commit()
+    with _turn() as t:
+        db, user = t.db, t.user
+        # naive de-dup: same text + horizon -> update; else insert
+        g = next((g for g in t.goals() if g.text == text and g.horizon == horizon), None)
+        if not g:
+            g = Goal(
+                user_id=user.id, horizon=horizon, text=text, metric=metric, target=target
+            )
+            db.add(g)
+            user_state.goal_changed(db, user.id, None, user_state.goal_key(g))
+        else:
+            g.metric = metric
+            g.target = target
+        versions.bump(db, user.id, "goals")
+        db.commit()
+        t.forget("goals")
+    plan_cache.invalidate_user(user.id)
     return f"Saved goal ({horizon}): {text}"
 
 
-@tool
-def list_goals() -> Dict[str, List[Dict[str, Any]]]:
-    """
-    Return goals grouped by horizon for quick summary.
-    """
-    db = _db()
-    user = _ensure_user(db)
-    gs = (
-        db.query(Goal)
-        .filter(Goal.user_id == user.id)
-        .order_by(Goal.horizon.asc(), Goal.created_at.asc())
-        .all()
-    )
+def _goal_groups(goals: List[Goal]) -> Dict[str, List[Dict[str, Any]]]:
     short = [
         {"text": g.text, "metric": g.metric, "target": g.target}
-        for g in gs
+        for g in goals
         if (g.horizon or "").startswith("short") or g.horizon in ("14d", "90d")
     ]
     long = [
         {"text": g.text, "metric": g.metric, "target": g.target}
-        for g in gs
+        for g in goals
         if (g.horizon or "").startswith("long") or g.horizon in ("12m",)
     ]
-    other = [
-        {"text": g.text, "metric": g.metric, "target": g.target}
-        for g in gs
-        if g not in []
-    ]
+    other = [{"text": g.text, "metric": g.metric, "target": g.target} for g in goals]
     return {"short": short, "long": long, "other": other}
 
 
+@tool
+def list_goals() -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Return goals grouped by horizon for quick summary.
+    """
+    with _turn() as t:
+        return _goal_groups(t.goals())
+
+
 @tool
 def goal_summary() -> str:
     """
     Human-friendly one-liner summary of short & long term goals.
     """
-    groups = list_goals()
+    with _turn() as t:
+        groups = _goal_groups(t.goals())
     s = []
     if groups["short"]:
         s.append("Short-term: " + "; ".join(g["text"] for g in groups["short"]))
@@ -115,55 +216,6 @@ def goal_summary() -> str:
 
 
 # ---------- Tasks & events helpers ----------
-KEYWORDS_HEALTH = (
-    "exercise",
-    "workout",
-    "run",
-    "walk",
-    "yoga",
-    "skipping",
-    "skip",
-    "gym",
-)
-KEYWORDS_REL = (
-    "dinner",
-    "lunch",
-    "coffee",
-    "meet",
-    "hangout",
-    "call",
-    "parents",
-    "mom",
-    "dad",
-    "friend",
-    "husband",
-    "wife",
-    "partner",
-)
-
-
-def _days_since_last(
-    db: Session, user: User, keywords: tuple[str, ...]
-) -> Optional[int]:
-    """
-    Naive heuristic: find latest calendar event whose summary contains any keyword.
-    """
-    ev = (
-        db.query(Event)
-        .filter(Event.user_id == user.id)
-        .filter(
-            func.lower(Event.summary).op("REGEXP")(
-                f"({'|'.join(kw.lower() for kw in keywords)})"
-            )
-        )
-        .order_by(Event.start.desc())
-        .first()
-    )
-    if not ev or not ev.start:
-        return None
-    return (datetime.utcnow() - ev.start.replace(tzinfo=None)).days
-
-
 @tool
 def suggest_next_actions() -> Dict[str, Any]:
     """
@@ -174,100 +226,32 @@ def suggest_next_actions() -> Dict[str, Any]:
       - If 'meditation' is a coping strategy and not scheduled in AM -> suggest AM 10m meditation.
       - If finance/invest appears in goals -> suggest 'invest VTI %salary' or review funds weekly.
     """
-    db = _db()
-    user = _ensure_user(db)
-    groups = list_goals()
-    short_text = " ".join([g["text"].lower() for g in groups["short"]])
-    long_text = " ".join([g["text"].lower() for g in groups["long"]])
-    advice: List[str] = []
-    suggested_tasks: List[Dict[str, Any]] = []
-
-    # Health cadence
-    since_health = _days_since_last(db, user, KEYWORDS_HEALTH) or 999
-    if (
-        "lose" in short_text or "weight" in short_text or "health" in short_text
-    ) and since_health > 7:
-        advice.append(
-            f"It’s been {since_health} days since a health activity; schedule a 30m workout."
-        )
-        suggested_tasks.append(
-            {"title": "30m strength or 3-mile walk", "pillar": "Health", "impact": 5}
-        )
-
-    # Relationships cadence
-    since_rel = _days_since_last(db, user, KEYWORDS_REL) or 999
-    if (
-        any(
-            k in (short_text + " " + long_text)
-            for k in ["friends", "family", "husband", "parents", "relationships"]
-        )
-        and since_rel > 10
-    ):
-        advice.append(
-            f"No social time logged in {since_rel} days; message a friend and schedule dinner."
-        )
-        suggested_tasks.append(
-            {
-                "title": "Text a friend & set dinner",
-                "pillar": "Relationships",
-                "impact": 4,
-            }
-        )
-
-    # Meditation / affirmations nudges
-    if any("medit" in g["text"].lower() for g in groups["short"] + groups["long"]):
-        advice.append(
-            "Add 10m morning meditation + 2-line gratitude to stabilize mood."
-        )
-        suggested_tasks.append(
-            {
-                "title": "10m morning meditation + gratitude",
-                "pillar": "Personal",
-                "impact": 4,
-            }
-        )
-
-    # Finance nudges
-    if any(
-        k in (short_text + " " + long_text)
-        for k in ["invest", "finance", "house", "vti", "eb1", "immigration", "file"]
-    ):
-        advice.append(
-            "Block 25m for finances: review VTI auto-invest %, set EB1 document task, and weekly money review."
-        )
-        suggested_tasks.append(
-            {
-                "title": "Finance block: review VTI %, EB1 docs",
-                "pillar": "Money",
-                "impact": 5,
-            }
-        )
-
-    return {"advice": advice, "suggested_tasks": suggested_tasks}
+    with _turn() as t:
+        # Small primary-key reads of the derived counters (services/user_state.py).
+        state = user_state.snapshot(t.db, t.user.id)
+        t.db.commit()  # persists the snapshot if this was the user's first read
+    return user_state.next_actions(state)
 
 
 @tool
 def add_task(title: str, pillar: str | None = None, impact: int = 2) -> str:
     """Create a task in your to-do list."""
-    db = _db()
-    user = _ensure_user(db)
-    db.add(Task(user_id=user.id, title=title, pillar=pillar, impact=int(impact)))
-    db.commit()
+    with _turn() as t:
+        db, user = t.db, t.user
+        db.add(Task(user_id=user.id, title=title, pillar=pillar, impact=int(impact)))
+        user_state.task_changed(db, user.id, None, (pillar, "open"))
+        versions.bump(db, user.id, "tasks")
+        db.commit()
+        t.forget("tasks")
+    plan_cache.invalidate_user(user.id)
     return f"Task added: {title}"
 
 
 @tool
 def list_today_events() -> List[Dict[str, Any]]:
     """Return today's events already synced from Google Calendar."""
-    db = _db()
-    user = _ensure_user(db)
-    start, end = day_bounds(user.tz)
-    evs = (
-        db.query(Event)
-        .filter(Event.user_id == user.id, Event.start >= start, Event.end <= end)
-        .order_by(Event.start.asc())
-        .all()
-    )
+    with _turn() as t:
+        evs = t.events()
     return [
         {
             "title": e.summary,
@@ -280,84 +264,76 @@ def list_today_events() -> List[Dict[str, Any]]:
 
 
 @tool
-async def plan_today() -> Dict[str, Any]:
-    """Run the planner to produce an Eisenhower matrix and a timeboxed schedule."""
-    db = _db()
-    user = _ensure_user(db)
-    start, end = day_bounds(user.tz)
-    tasks = (
-        db.query(Task)
-        .filter(Task.user_id == user.id, Task.status == "open")
-        .order_by(Task.impact.desc())
-        .limit(50)
-        .all()
-    )
-    goals = db.query(Goal).filter(Goal.user_id == user.id).all()
-    stressors = db.query(Stressor).filter(Stressor.user_id == user.id).all()
-    events = (
-        db.query(Event)
-        .filter(Event.user_id == user.id, Event.start >= start, Event.end <= end)
-        .all()
-    )
+def find_free_time(
+    days: int = 7,
+    min_minutes: int = 30,
+    with_emails: Optional[str] = None,
+    work_start: int = 9,
+    work_end: int = 18,
+    weekends: bool = False,
+) -> List[Dict[str, str]]:
+    """
+    Free windows of at least `min_minutes` over the next `days` (max 90), inside working hours.
+    `with_emails` (comma-separated) finds times when you and those people are ALL free.
+    """
+    with _turn() as t:
+        db, user = t.db, t.user
+        user_ids = [user.id]
+        if with_emails:
+            emails = [e.strip() for e in with_emails.split(",") if e.strip()]
+            user_ids += [u.id for u in db.query(User).filter(User.email.in_(emails)).all()]
+        now = datetime.now(ZoneInfo(user.tz)).replace(tzinfo=None, second=0, microsecond=0)
+        res = freebusy.find_free(
+            db,
+            user_ids,
+            now,
+            now + timedelta(days=max(1, min(int(days), 90))),
+            min_minutes=int(min_minutes),
+            work_hours=(int(work_start), int(work_end)),
+            weekdays=range(7) if weekends else range(5),
+        )
+    return [
+        {"start": s.isoformat(timespec="minutes"), "end": e.isoformat(timespec="minutes")}
+        for s, e in res["windows"][:50]
+    ]
 
-    context = {
-        "identity": {"name": "You", "tz": user.tz},
-        "tasks": [
-            {
-                "title": t.title,
-                "pillar": t.pillar,
-                "impact": t.impact,
-                "dueAt": t.due_at.isoformat() if t.due_at else None,
-            }
-            for t in tasks
-        ],
-        "goals": [
-            {
-                "horizon": g.horizon,
-                "text": g.text,
-                "metric": g.metric,
-                "target": g.target,
-            }
-            for g in goals
-        ],
-        "stressors": [
-            {"trigger": s.trigger, "pattern": s.pattern, "coping": s.coping}
-            for s in stressors
-        ],
-        "events": [
-            {
-                "title": e.summary,
-                "start": e.start.isoformat() if e.start else None,
-                "end": e.end.isoformat() if e.end else None,
-                "location": e.location,
-            }
-            for e in events
-        ],
-    }
-    payload = await call_claude(context)
-    return {
-        "eisenhower": payload.eisenhower.model_dump(),
-        "schedule": [s.model_dump() for s in payload.schedule],
-        "affirmations": payload.affirmations,
-        "three_needles": payload.three_needles,
-        "stress_guide": [r.model_dump() for r in payload.stress_guide],
-        "nudges": payload.nudges,
-    }
+
+@tool
+async def plan_today(engine: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run the planner to produce an Eisenhower matrix and a timeboxed schedule.
+    engine: 'local' (instant solver), 'llm' or 'hybrid'; default from settings.
+    """
+    # Only the context build touches the DB; the lock is released before the model call.
+    with _turn() as t:
+        db, user, context = t.db, t.user, t.planner_context()
+    return await plan_for_user(db, user, engine=engine, context=context)
 
 
 # ---------- Agent factory ----------
+_model: Optional[AnthropicModel] = None
+
+
+def _shared_model() -> AnthropicModel:
+    """One model (and so one Anthropic HTTP client/connection pool) for every agent."""
+    global _model
+    if _model is None:
+        _model = AnthropicModel(
+            client_args={"api_key": settings.anthropic_key},
+            model_id="claude-sonnet-4-20250514",
+            max_tokens=1024,
+            params={"temperature": 0.4},
+        )
+    return _model
+
+
 def build_agent(username: str = "Nidhi") -> Agent:
     if not settings.anthropic_key:
         raise RuntimeError(
             "ANTHROPIC_API_KEY is not set. Chat requires an Anthropic key."
         )
 
-    model = AnthropicModel(
-        client_args={"api_key": settings.anthropic_key},
-        model_id="claude-sonnet-4-20250514",
-        max_tokens=1024,
-        params={"temperature": 0.4},
-    )
+    model = _shared_model()
 
     system_prompt = (
         f"You are a caring personal assistant. The user's name is {username}. "
@@ -365,6 +341,7 @@ def build_agent(username: str = "Nidhi") -> Agent:
         "If none exist, ask concise questions to capture short goals (<=90d) and long goals (>=12m), "
         "then call upsert_goal() accordingly; confirm back to the user. "
         "Use list_today_events() to be context-aware. "
+        "For 'when am I/are we free' questions, call find_free_time(). "
         "Proactively call suggest_next_actions() to nudge when cadence is off (health/social/finance/meditation). "
         "When the user asks to plan or prioritize, call plan_today() and present an Eisenhower matrix + 3 key 'needles'. "
         "Always format your entire reply in GitHub-Flavored Markdown. "
@@ -383,7 +360,64 @@ def build_agent(username: str = "Nidhi") -> Agent:
             suggest_next_actions,
             add_task,
             list_today_events,
+            find_free_time,
             plan_today,
         ],
         system_prompt=system_prompt,
     )
+
+
+# ---------- Agent pool ----------
+class AgentPool:
+    """
+    Per-username agents that keep their conversation history between turns.
+    LRU-capped at `max_size`; agents idle longer than `idle_ttl_s` are dropped.
+    Turns for the same user are serialized (an Agent is not re-entrant), so
+    neither limit evicts an agent mid-turn; the pool can briefly exceed
+    `max_size` while every older agent is busy.
+    """
+
+    def __init__(self, max_size: int, idle_ttl_s: float):
+        self.max_size = max_size
+        self.idle_ttl_s = idle_ttl_s
+        self._agents: "OrderedDict[str, list]" = OrderedDict()  # name -> [agent, lock, last_used]
+
+    def _evict_idle(self, now: float) -> None:
+        for name in [n for n, e in self._agents.items() if now - e[2] > self.idle_ttl_s]:
+            if not self._agents[name][1].locked():
+                del self._agents[name]
+
+    def _evict_lru(self, keep: str) -> None:
+        for name in [n for n in self._agents if n != keep]:
+            if len(self._agents) <= self.max_size:
+                return
+            if not self._agents[name][1].locked():
+                del self._agents[name]
+
+    @asynccontextmanager
+    async def acquire(self, username: str) -> AsyncIterator[Agent]:
+        now = time.monotonic()
+        self._evict_idle(now)
+        entry = self._agents.get(username)
+        if entry is None:
+            entry = [build_agent(username=username), asyncio.Lock(), now]
+            self._agents[username] = entry
+            self._evict_lru(keep=username)
+        self._agents.move_to_end(username)
+        async with entry[1]:
+            entry[2] = time.monotonic()
+            try:
+                with open_turn():
+                    yield entry[0]
+            finally:
+                entry[2] = time.monotonic()
+
+    def reset(self, username: str) -> bool:
+        """Forget a user's conversation; the next turn starts fresh."""
+        return self._agents.pop(username, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+
+agent_pool = AgentPool(settings.chat_pool_max, settings.chat_idle_ttl_s)
@@ -0,0 +1,229 @@
+"""Google Calendar push notifications: watch channels, webhook handling, debounced sync."""
+import asyncio
+import secrets
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Mapping, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.calendar_account import CalendarAccount
+from app.models.user import User
+from app.services.google_calendar import _service, sync_primary
+from app.services.plan_cache import plan_cache
+
+CHANNEL_TTL = timedelta(days=7)  # Google caps events.watch channels at ~7 days
+RENEW_AHEAD = timedelta(hours=12)
+
+
+class SyncDebouncer:
+    """
+    Coalesce bursts of notifications per account into one sync after `delay_s`.
+    Notifications that land while a sync is running cause exactly one follow-up sync.
+    """
+
+    def __init__(self, delay_s: float, runner: Callable[[str], Awaitable[None]]):
+        self.delay_s = delay_s
+        self._runner = runner
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._dirty: set[str] = set()
+        self.received = 0
+        self.syncs = 0
+
+    def notify(self, acct_id: str) -> None:
+        self.received += 1
+        if acct_id in self._tasks:
+            self._dirty.add(acct_id)
+            return
+        self._tasks[acct_id] = asyncio.create_task(self._run(acct_id))
+
+    async def _run(self, acct_id: str) -> None:
+        try:
+            while True:
+                await asyncio.sleep(self.delay_s)
+                self._dirty.discard(acct_id)
+                self.syncs += 1
+                try:
+                    await self._runner(acct_id)
+                except Exception as e:
+                    print(f"Push sync failed for calendar account {acct_id}:", repr(e))
+                if acct_id not in self._dirty:
+                    return
+        finally:
+            self._tasks.pop(acct_id, None)
+
+    async def drain(self) -> None:
+        """Wait for all pending syncs (used on shutdown and by the local notifier)."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+
+async def _sync_account(acct_id: str) -> None:
+    db = SessionLocal()
+    try:
+        acct = db.get(CalendarAccount, acct_id)
+        if not acct or acct.revoked:
+            return
+        user = db.get(User, acct.user_id)
+        await sync_primary(db, user, days_forward=30)
+        plan_cache.invalidate_user(user.id)
+    finally:
+        db.close()
+
+
+debouncer = SyncDebouncer(settings.calendar_debounce_s, _sync_account)
+
+
+# ---------- channels ----------
+def _is_local() -> bool:
+    return not settings.google_webhook_url
+
+
+async def start_watch(db: Session, acct: CalendarAccount) -> Dict:
+    """
+    Open a push channel for the primary calendar and store it on acct.meta["watch"].
+    Without GOOGLE_WEBHOOK_URL a local channel is created instead (see LocalNotifier).
+    """
+    channel_id = f"{acct.id}-{uuid.uuid4().hex[:12]}"
+    token = secrets.token_urlsafe(24)
+    if _is_local():
+        watch = {
+            "kind": "local",
+            "channel_id": channel_id,
+            "resource_id": f"local-{acct.id}",
+            "token": token,
+            "expiration": (datetime.utcnow() + CHANNEL_TTL).isoformat(),
+        }
+    else:
+        resp = await _service(db, acct).request(
+            "POST",
+            "/calendars/primary/events/watch",
+            json={
+                "id": channel_id,
+                "type": "web_hook",
+                "address": settings.google_webhook_url,
+                "token": token,
+                "params": {"ttl": str(int(CHANNEL_TTL.total_seconds()))},
+            },
+        )
+        expires_ms = int(resp.get("expiration") or 0)
+        watch = {
+            "kind": "google",
+            "channel_id": channel_id,
+            "resource_id": resp["resourceId"],
+            "token": token,
+            "expiration": (
+                datetime.utcfromtimestamp(expires_ms / 1000)
+                if expires_ms
+                else datetime.utcnow() + CHANNEL_TTL
+            ).isoformat(),
+        }
+    meta = dict(acct.meta or {})
+    old = meta.get("watch")
+    meta["watch"] = watch
+    acct.meta = meta
+    db.commit()
+    if old:
+        await _stop_channel(db, acct, old)
+    return watch
+
+
+async def _stop_channel(db: Session, acct: CalendarAccount, watch: Mapping) -> None:
+    if watch.get("kind") != "google":
+        return
+    try:
+        await _service(db, acct).request(
+            "POST",
+            "/channels/stop",
+            json={"id": watch["channel_id"], "resourceId": watch["resource_id"]},
+        )
+    except Exception as e:
+        # Channel may already be expired; Google then just stops sending.
+        print(f"Stopping channel {watch.get('channel_id')} failed:", repr(e))
+
+
+async def stop_watch(db: Session, acct: CalendarAccount) -> bool:
+    meta = dict(acct.meta or {})
+    watch = meta.pop("watch", None)
+    if not watch:
+        return False
+    acct.meta = meta
+    db.commit()
+    await _stop_channel(db, acct, watch)
+    return True
+
+
+async def renew_expiring_channels(ahead: timedelta = RENEW_AHEAD) -> int:
+    """Replace channels that expire within `ahead`. Run periodically."""
+    db = SessionLocal()
+    renewed = 0
+    try:
+        cutoff = datetime.utcnow() + ahead
+        accts = db.query(CalendarAccount).filter(CalendarAccount.revoked == False).all()  # noqa: E712
+        for acct in accts:
+            watch = (acct.meta or {}).get("watch")
+            if not watch or datetime.fromisoformat(watch["expiration"]) > cutoff:
+                continue
+            try:
+                await start_watch(db, acct)
+                renewed += 1
+            except Exception as e:
+                db.rollback()
+                print(f"Channel renewal failed for calendar account {acct.id}:", repr(e))
+    finally:
+        db.close()
+    return renewed
+
+
+# ---------- webhook ----------
+def handle_notification(db: Session, headers: Mapping[str, str]) -> Optional[str]:
+    """
+    Validate Google's X-Goog-* headers against the stored channel and queue a
+    debounced sync. Returns the account id, or None if the message is not ours.
+    """
+    channel_id = headers.get("x-goog-channel-id") or ""
+    acct_id = channel_id.split("-", 1)[0]
+    acct = db.get(CalendarAccount, acct_id) if acct_id else None
+    watch = (acct.meta or {}).get("watch") if acct else None
+    if (
+        not watch
+        or acct.revoked
+        or watch["channel_id"] != channel_id
+        or not secrets.compare_digest(watch["token"], headers.get("x-goog-channel-token") or "")
+        or watch["resource_id"] != headers.get("x-goog-resource-id")
+    ):
+        return None
+    state = headers.get("x-goog-resource-state")
+    if state == "sync" and (acct.meta or {}).get("sync_token"):
+        return acct.id  # channel handshake; nothing changed yet
+    debouncer.notify(acct.id)
+    return acct.id
+
+
+class LocalNotifier:
+    """Offline stand-in for Google: emits the same headers a real push would carry."""
+
+    def __init__(self):
+        self._numbers: Dict[str, int] = {}
+
+    def headers_for(self, acct: CalendarAccount, state: str = "exists") -> Dict[str, str]:
+        watch = (acct.meta or {})["watch"]
+        n = self._numbers[acct.id] = self._numbers.get(acct.id, 0) + 1
+        return {
+            "x-goog-channel-id": watch["channel_id"],
+            "x-goog-channel-token": watch["token"],
+            "x-goog-resource-id": watch["resource_id"],
+            "x-goog-resource-state": state,
+            "x-goog-message-number": str(n),
+        }
+
+    def push(self, db: Session, acct: CalendarAccount, times: int = 1) -> Optional[str]:
+        acct_id = None
+        for _ in range(times):
+            acct_id = handle_notification(db, self.headers_for(acct))
+        return acct_id
+
+
+local_notifier = LocalNotifier()
@@ -1,3 +1,225 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+from zoneinfo import ZoneInfo
+
+from dateutil import parser as dateparse
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.event import Event
+from app.models.task import Task
+from app.models.user import User
+
+Interval = Tuple[datetime, datetime]
+
+# Candidate slots are searched inside this local-time window, on a 30-minute grid.
+DAY_START_H = 7
+DAY_END_H = 21
+SLOT_STEP = timedelta(minutes=30)
+# Events longer than this are not expected; bounds the indexed `start` range scan.
+MAX_EVENT_SPAN = timedelta(days=1)
+HIGH_IMPACT = 4
+
+
 def score_decision(relationship_value=1.0, wellbeing_delta=0.0, goal_disruption=0.5, schedule_cost=0.5):
     s = 0.4*relationship_value + 0.3*wellbeing_delta - 0.2*goal_disruption - 0.1*schedule_cost
     return max(-1.0, min(1.0, s))
+
+
+def parse_when(when: str, tz_name: str, now: datetime | None = None) -> datetime:
+    """Parse free-form `when` ("Wed 19:30", "2025-08-14T19:00") as user-local naive time.
+
+    Missing parts default to the next whole hour; a bare weekday means the next such day.
+    """
+    tz = ZoneInfo(tz_name)
+    now = (now or datetime.now(tz)).astimezone(tz)
+    default = now.replace(minute=0, second=0, microsecond=0, tzinfo=None) + timedelta(hours=1)
+    dt = dateparse.parse(when, default=default, fuzzy=True)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(tz).replace(tzinfo=None)
+    return dt
+
+
+def busy_intervals(db: Session, user_id: str, frm: datetime, to: datetime) -> List[Interval]:
+    """Sorted, merged busy intervals overlapping [frm, to).
+
+    Bounded on `start` so the lookup is a range scan on ix_event_user_start.
+    """
+    rows = (
+        db.query(Event.start, Event.end)
+        .filter(
+            Event.user_id == user_id,
+            Event.start >= frm - MAX_EVENT_SPAN,
+            Event.start < to,
+        )
+        .order_by(Event.start.asc())
+        .all()
+    )
+    merged: List[Interval] = []
+    for s, e in rows:
+        if e is None or e <= frm:
+            continue
+        if merged and s <= merged[-1][1]:
+            if e > merged[-1][1]:
+                merged[-1] = (merged[-1][0], e)
+        else:
+            merged.append((s, e))
+    return merged
+
+
+def overlaps(busy: List[Interval], start: datetime, end: datetime) -> int:
+    """Number of busy intervals overlapping [start, end); `busy` is sorted and merged."""
+    i = bisect_left(busy, (start,))
+    # The interval just before `start` may still run into the slot.
+    if i > 0 and busy[i - 1][1] > start:
+        i -= 1
+    n = 0
+    while i < len(busy) and busy[i][0] < end:
+        if busy[i][1] > start:
+            n += 1
+        i += 1
+    return n
+
+
+def high_impact_deadlines(db: Session, user_id: str, frm: datetime, to: datetime) -> List[Tuple[datetime, str]]:
+    """Open tasks with impact >= HIGH_IMPACT due within [frm, to), sorted by due date."""
+    rows = (
+        db.query(Task.due_at, Task.title)
+        .filter(
+            Task.user_id == user_id,
+            Task.status == "open",
+            Task.impact >= HIGH_IMPACT,
+            Task.due_at >= frm,
+            Task.due_at < to,
+        )
+        .all()
+    )
+    return sorted((due, title) for due, title in rows)
+
+
+def _deadlines_near(deadlines: List[Tuple[datetime, str]], start: datetime, end: datetime) -> List[str]:
+    # A deadline the same day or within the slot competes with the invite.
+    day_start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    lo = bisect_left(deadlines, (day_start,))
+    hi = bisect_left(deadlines, (max(end, day_start + timedelta(days=1)),))
+    return [title for _, title in deadlines[lo:hi]]
+
+
+def _slot_score(conflicts: int, travel_min: int, deadlines: int) -> float:
+    schedule_cost = min(1.0, conflicts * 0.5 + travel_min / 90)
+    goal_disruption = min(1.0, 0.2 + 0.3 * deadlines)
+    return score_decision(
+        relationship_value=0.8,
+        wellbeing_delta=0.2,
+        goal_disruption=goal_disruption,
+        schedule_cost=schedule_cost,
+    )
+
+
+def _fmt(dt: datetime) -> str:
+    return dt.strftime("%a %H:%M")
+
+
+def free_slots(
+    busy: List[Interval],
+    deadlines: List[Tuple[datetime, str]],
+    wanted: datetime,
+    duration: timedelta,
+    travel: timedelta,
+    frm: datetime,
+    days: int,
+    limit: int = 3,
+) -> List[Dict[str, Any]]:
+    """Conflict-free slots (travel included) in the next `days`, best first.
+
+    Ties in `score_decision` go to the slot closest to the requested time of day.
+    """
+    wanted_min = wanted.hour * 60 + wanted.minute
+    candidates = []
+    day0 = frm.replace(hour=0, minute=0, second=0, microsecond=0)
+    for d in range(days + 1):
+        t = day0 + timedelta(days=d, hours=DAY_START_H)
+        last = day0 + timedelta(days=d, hours=DAY_END_H) - duration
+        while t <= last:
+            if t >= frm and t != wanted and not overlaps(busy, t - travel, t + duration + travel):
+                near = _deadlines_near(deadlines, t, t + duration)
+                score = _slot_score(0, int(travel.total_seconds() // 60), len(near))
+                drift = abs(t.hour * 60 + t.minute - wanted_min)
+                candidates.append((-score, drift, t, near))
+            t += SLOT_STEP
+    candidates.sort(key=lambda c: (c[0], c[1], c[2]))
+
+    out = []
+    for neg_score, drift, t, near in candidates[:limit]:
+        if near:
+            reason = f"free; {len(near)} high-impact deadline(s) that day"
+        elif drift == 0:
+            reason = "free at the same time"
+        else:
+            reason = "no conflicts"
+        out.append({"when": _fmt(t), "start": t.isoformat(), "score": round(-neg_score, 3), "reason": reason})
+    return out
+
+
+def decide_invite(
+    db: Session,
+    user: User,
+    when: str,
+    duration_min: int = 60,
+    travel_min: int = 0,
+    now: datetime | None = None,
+) -> Dict[str, Any]:
+    """Check `when` against the user's calendar and deadlines, and rank free alternatives.
+
+    All lookups happen in two indexed queries covering the whole search horizon.
+    """
+    tz = ZoneInfo(user.tz or settings.default_tz)
+    local_now = (now or datetime.now(tz)).astimezone(tz).replace(tzinfo=None)
+    start = parse_when(when, user.tz or settings.default_tz, now)
+    duration = timedelta(minutes=max(1, duration_min))
+    travel = timedelta(minutes=max(0, travel_min))
+    end = start + duration
+
+    horizon_start = min(local_now, start - travel)
+    horizon_end = max(
+        start.replace(hour=0, minute=0, second=0, microsecond=0),
+        local_now.replace(hour=0, minute=0, second=0, microsecond=0),
+    ) + timedelta(days=settings.invite_search_days + 1)
+    busy = busy_intervals(db, user.id, horizon_start, horizon_end)
+    deadlines = high_impact_deadlines(db, user.id, horizon_start, horizon_end)
+
+    conflicts = overlaps(busy, start - travel, end + travel)
+    near = _deadlines_near(deadlines, start, end)
+    s = _slot_score(conflicts, travel_min, len(near))
+    accept = s > 0.1 and conflicts == 0 and start >= local_now
+
+    tradeoffs: List[str] = []
+    if conflicts:
+        tradeoffs.append(f"Overlaps {conflicts} busy block(s) on your calendar" + (" incl. travel" if travel_min else ""))
+    for title in near:
+        tradeoffs.append(f"High-impact deadline nearby: {title}")
+    if start < local_now:
+        tradeoffs.append("Requested time is in the past")
+    if accept and not tradeoffs:
+        tradeoffs.append("Fits your calendar as-is")
+
+    alternatives = free_slots(
+        busy,
+        deadlines,
+        wanted=start,
+        duration=duration,
+        travel=travel,
+        frm=max(local_now, start.replace(hour=0, minute=0, second=0, microsecond=0)),
+        days=settings.invite_search_days,
+    )
+    return {
+        "accept": accept,
+        "score": round(s, 3),
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "conflicts": conflicts,
+        "deadlines": near,
+        "tradeoffs": tradeoffs,
+        "alternatives": alternatives,
+    }
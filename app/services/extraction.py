@@ -0,0 +1,214 @@
+"""
+Inbox extraction stage: turn pending `invite`/`task` messages into Task rows
+and invite decisions.
+
+Pending messages are packed `settings.extract_batch_size` at a time into ONE
+forced-tool model call, so the per-call overhead (system prompt, schema,
+round-trip) is paid once per batch instead of once per email. Without an
+Anthropic key nothing is extracted: messages stay pending (a header-only guess
+would mark them processed for good) and are picked up once a key is configured.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from dateutil import parser as dateparse
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.time import now_tz
+from app.db.session import SessionLocal
+from app.models.common import now_utc
+from app.models.message import Message
+from app.models.task import Task
+from app.models.user import User
+from app.services.decision import decide_invite
+from app.services.plan_cache import plan_cache
+from app.services import versions
+from app.services import user_state
+from app.services.llm import create, tool_input
+
+INTENTS = ("invite", "task")
+PILLARS = ["Money", "Health", "Relationships", "Work", "Personal"]
+MAX_BODY_CHARS = 1500
+
+SYSTEM = (
+    "You extract actionable items from a batch of inbox messages. "
+    "Call submit_extractions with one item per message, using the message's `ref`. "
+    "kind=task: a short imperative title, pillar, impact 1-5 and due (ISO 8601, or null). "
+    "kind=invite: when (ISO 8601 local time, or the original phrase), who, location. "
+    "kind=none when the message has nothing actionable. Today is given as `today`."
+)
+
+EXTRACT_TOOL = {
+    "name": "submit_extractions",
+    "description": "Structured tasks/invites for each message in the batch.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "items": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "ref": {"type": "integer"},
+                        "kind": {"type": "string", "enum": ["task", "invite", "none"]},
+                        "title": {"type": "string"},
+                        "pillar": {"type": "string", "enum": PILLARS},
+                        "impact": {"type": "integer", "minimum": 1, "maximum": 5},
+                        "due": {"type": ["string", "null"]},
+                        "when": {"type": ["string", "null"]},
+                        "who": {"type": ["string", "null"]},
+                        "location": {"type": ["string", "null"]},
+                    },
+                    "required": ["ref", "kind"],
+                },
+            }
+        },
+        "required": ["items"],
+    },
+    "cache_control": {"type": "ephemeral"},
+}
+
+
+def pending_messages(db: Session, user_id: str, limit: int) -> List[Message]:
+    return (
+        db.query(Message)
+        .filter(
+            Message.user_id == user_id,
+            Message.intent.in_(INTENTS),
+            Message.processed_at.is_(None),
+        )
+        .order_by(Message.ts.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def _brief(ref: int, m: Message) -> Dict[str, Any]:
+    body = ((m.data or {}).get("body") or "")[:MAX_BODY_CHARS]
+    return {"ref": ref, "intent": m.intent, "from": m.from_addr, "subject": m.subject, "body": body}
+
+
+def _heuristic(ref: int, m: Message) -> Dict[str, Any]:
+    title = (m.subject or ((m.data or {}).get("body") or "").strip().split("\n")[0] or "Inbox item")[:120]
+    if m.intent == "invite":
+        return {"ref": ref, "kind": "invite", "when": title, "who": m.from_addr, "location": None}
+    return {"ref": ref, "kind": "task", "title": title, "impact": 2, "due": None}
+
+
+async def extract_batch(
+    messages: List[Message], tz: str, user_id: str | None = None
+) -> List[Dict[str, Any]]:
+    """One model call for the whole batch; items are keyed by `ref` (index in `messages`)."""
+    body = {
+        "today": now_tz(tz).date().isoformat(),
+        "tz": tz,
+        "messages": [_brief(i, m) for i, m in enumerate(messages)],
+    }
+    resp = await create(
+        "extract", SYSTEM, body, 200 + 120 * len(messages), 0.0, None, user_id, tool=EXTRACT_TOOL
+    )
+    items = tool_input(resp, EXTRACT_TOOL["name"]).get("items") or []
+    by_ref = {it.get("ref"): it for it in items if isinstance(it, dict)}
+    # Messages the model skipped still get the heuristic, so nothing stays pending forever.
+    return [by_ref.get(i) or _heuristic(i, m) for i, m in enumerate(messages)]
+
+
+def _parse_dt(s: Optional[str]) -> Optional[datetime]:
+    if not s:
+        return None
+    try:
+        return dateparse.parse(s).replace(tzinfo=None)
+    except (ValueError, OverflowError):
+        return None
+
+
+def apply_items(db: Session, user: User, messages: List[Message], items: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Write tasks/invite decisions, mark messages processed. Does not commit."""
+    stats = {"tasks": 0, "invites": 0, "skipped": 0}
+    now = now_utc()
+    for m, it in zip(messages, items):
+        kind = it.get("kind")
+        data = dict(m.data or {})
+        if kind == "task" and it.get("title"):
+            pillar = it.get("pillar") if it.get("pillar") in PILLARS else None
+            impact = max(1, min(5, int(it.get("impact") or 2)))
+            task = Task(
+                user_id=user.id, title=it["title"][:200], pillar=pillar, impact=impact,
+                due_at=_parse_dt(it.get("due")), source="inbox",
+            )
+            db.add(task)
+            db.flush()
+            user_state.task_changed(db, user.id, None, user_state.task_key(task))
+            data["extracted"] = {"kind": "task", "task_id": task.id}
+            stats["tasks"] += 1
+        elif kind == "invite":
+            invite = {k: it.get(k) for k in ("when", "who", "location")}
+            decision = None
+            if invite["when"]:
+                try:
+                    decision = decide_invite(db, user, invite["when"])
+                except (ValueError, OverflowError):
+                    decision = None
+            data["extracted"] = {"kind": "invite", **invite, "decision": decision}
+            stats["invites"] += 1
+        else:
+            data["extracted"] = {"kind": "none"}
+            stats["skipped"] += 1
+        m.data = data
+        m.processed_at = now
+    return stats
+
+
+async def process_user(db: Session, user: User, max_batches: int = 10) -> Dict[str, int]:
+    """Drain up to `max_batches` batches of pending messages for one user."""
+    totals = {"batches": 0, "messages": 0, "tasks": 0, "invites": 0, "skipped": 0}
+    if not settings.anthropic_key:
+        return totals
+    for _ in range(max_batches):
+        batch = pending_messages(db, user.id, settings.extract_batch_size)
+        if not batch:
+            break
+        items = await extract_batch(batch, user.tz, user.id)
+        stats = apply_items(db, user, batch, items)
+        if stats["tasks"]:
+            versions.bump(db, user.id, "tasks")
+        db.commit()
+        totals["batches"] += 1
+        totals["messages"] += len(batch)
+        for k, v in stats.items():
+            totals[k] += v
+    if totals["tasks"]:
+        plan_cache.invalidate_user(user.id)
+    return totals
+
+
+async def process_pending() -> Dict[str, int]:
+    """Scheduler entry point: run the extraction stage for every user with pending messages."""
+    totals: Dict[str, int] = {}
+    if not settings.anthropic_key:
+        return totals
+    db = SessionLocal()
+    try:
+        user_ids = [
+            uid
+            for (uid,) in db.query(Message.user_id)
+            .filter(Message.intent.in_(INTENTS), Message.processed_at.is_(None))
+            .distinct()
+            .all()
+        ]
+        for uid in user_ids:
+            user = db.get(User, uid)
+            if not user:
+                continue
+            try:
+                stats = await process_user(db, user)
+            except Exception as e:
+                db.rollback()
+                print(f"Inbox extraction failed for user {uid}:", repr(e))
+                continue
+            for k, v in stats.items():
+                totals[k] = totals.get(k, 0) + v
+    finally:
+        db.close()
+    return totals
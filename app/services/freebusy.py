@@ -0,0 +1,147 @@
+"""
+Free/busy as per-minute occupancy bitmaps.
+
+A range [frm, to) becomes a bool array with one slot per minute (90 days is
+~130k entries), so combining calendars and finding gaps are whole-array NumPy
+operations instead of interval bookkeeping. Times are user-local and naive, the
+same wall-clock convention the synced `Event` rows use.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models.event import Event
+
+MAX_RANGE = timedelta(days=90)
+# Bounds the indexed `start` range scan; longer events are clipped to this look-back.
+MAX_EVENT_SPAN = timedelta(days=1)
+
+
+def _minutes(frm: datetime, to: datetime) -> int:
+    if to <= frm:
+        raise ValueError("range end must be after its start")
+    if to - frm > MAX_RANGE:
+        raise ValueError(f"range is limited to {MAX_RANGE.days} days")
+    return int((to - frm).total_seconds() // 60)
+
+
+def bitmap(intervals: Iterable[Tuple[datetime, datetime]], frm: datetime, to: datetime) -> np.ndarray:
+    """Busy bitmap for [frm, to): True where at least one interval covers the minute."""
+    n = _minutes(frm, to)
+    pairs = [(s, e) for s, e in intervals if s is not None and e is not None]
+    if not pairs:
+        return np.zeros(n, dtype=bool)
+    base = np.datetime64(frm, "m")
+    starts = (np.array([s for s, _ in pairs], dtype="datetime64[m]") - base).astype(np.int64)
+    # Round partial end minutes up so a 10:00:30 end still blocks 10:00.
+    ends = (
+        np.array([e + timedelta(seconds=59) for _, e in pairs], dtype="datetime64[m]") - base
+    ).astype(np.int64)
+    starts = np.clip(starts, 0, n)
+    ends = np.clip(ends, 0, n)
+    keep = ends > starts
+    # Difference array: +1 at each start, -1 at each end; running sum > 0 is busy.
+    diff = np.zeros(n + 1, dtype=np.int32)
+    np.add.at(diff, starts[keep], 1)
+    np.add.at(diff, ends[keep], -1)
+    return np.cumsum(diff[:-1]) > 0
+
+
+def load_bitmaps(
+    db: Session,
+    user_ids: Sequence[str],
+    frm: datetime,
+    to: datetime,
+    providers: Sequence[str] | None = None,
+) -> Dict[str, np.ndarray]:
+    """One busy bitmap per user (optionally only some calendar providers), from one query."""
+    _minutes(frm, to)
+    q = db.query(Event.user_id, Event.start, Event.end).filter(
+        Event.user_id.in_(list(user_ids)),
+        Event.start >= frm - MAX_EVENT_SPAN,
+        Event.start < to,
+    )
+    if providers:
+        q = q.filter(Event.provider.in_(list(providers)))
+    by_user: Dict[str, list] = {uid: [] for uid in user_ids}
+    for uid, s, e in q.all():
+        by_user[uid].append((s, e))
+    return {uid: bitmap(rows, frm, to) for uid, rows in by_user.items()}
+
+
+def union(bitmaps: Iterable[np.ndarray]) -> np.ndarray:
+    """Busy if anyone is busy (so free only when everyone is free)."""
+    return np.logical_or.reduce(list(bitmaps))
+
+
+def intersection(bitmaps: Iterable[np.ndarray]) -> np.ndarray:
+    """Busy only when everyone is busy (free if at least one person is free)."""
+    return np.logical_and.reduce(list(bitmaps))
+
+
+def working_hours_mask(
+    frm: datetime,
+    to: datetime,
+    start_hour: int = 9,
+    end_hour: int = 18,
+    weekdays: Iterable[int] = (0, 1, 2, 3, 4),
+) -> np.ndarray:
+    """True for minutes inside [start_hour, end_hour) on the given weekdays (Mon=0)."""
+    n = _minutes(frm, to)
+    stamps = np.datetime64(frm, "m") + np.arange(n)
+    minute_of_day = (stamps - stamps.astype("datetime64[D]")).astype(np.int64)
+    # 1970-01-01 was a Thursday (weekday 3).
+    weekday = (stamps.astype("datetime64[D]").astype(np.int64) + 3) % 7
+    return (
+        (minute_of_day >= start_hour * 60)
+        & (minute_of_day < end_hour * 60)
+        & np.isin(weekday, list(weekdays))
+    )
+
+
+def free_windows(
+    busy: np.ndarray,
+    frm: datetime,
+    min_minutes: int = 30,
+    mask: np.ndarray | None = None,
+) -> List[Tuple[datetime, datetime]]:
+    """Maximal free runs of at least `min_minutes`, restricted to `mask` when given."""
+    free = ~busy if mask is None else (~busy & mask)
+    edges = np.diff(np.concatenate(([0], free.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    long_enough = (ends - starts) >= max(1, min_minutes)
+    return [
+        (frm + timedelta(minutes=int(s)), frm + timedelta(minutes=int(e)))
+        for s, e in zip(starts[long_enough], ends[long_enough])
+    ]
+
+
+def find_free(
+    db: Session,
+    user_ids: Sequence[str],
+    frm: datetime,
+    to: datetime,
+    min_minutes: int = 30,
+    mode: str = "all",
+    work_hours: Tuple[int, int] | None = (9, 18),
+    weekdays: Iterable[int] = (0, 1, 2, 3, 4),
+    providers: Sequence[str] | None = None,
+) -> Dict[str, object]:
+    """
+    Free windows for a group. mode="all": everyone free; mode="any": someone free.
+    `work_hours=None` searches the whole day.
+    """
+    if mode not in ("all", "any"):
+        raise ValueError("mode must be 'all' or 'any'")
+    maps = load_bitmaps(db, user_ids, frm, to, providers)
+    busy = union(maps.values()) if mode == "all" else intersection(maps.values())
+    mask = working_hours_mask(frm, to, *work_hours, weekdays=weekdays) if work_hours else None
+    windows = free_windows(busy, frm, min_minutes, mask)
+    return {
+        "windows": windows,
+        "busy_minutes": {uid: int(m.sum()) for uid, m in maps.items()},
+        "free_minutes": sum(int((e - s).total_seconds() // 60) for s, e in windows),
+    }
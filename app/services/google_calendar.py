@@ -4,17 +4,23 @@ import os
 if os.getenv("OAUTHLIB_INSECURE_TRANSPORT") is None:
     os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
 
+import asyncio
 from datetime import datetime, timedelta
-from typing import Dict
+from typing import Any, Dict, List
+from urllib.parse import quote
 
-from google.oauth2.credentials import Credentials
+import httpx
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
 
+from app.db.session import SessionLocal
 from app.models.calendar_account import CalendarAccount
 from app.models.event import Event
 from app.models.user import User
+from app.models.common import gen_id
+from app.core.time import now_tz
+from app.services import activity
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql as pg_dialect, sqlite as sqlite_dialect
 from sqlalchemy.orm import Session
 from dateutil import parser as dateparse
 
@@ -87,23 +93,168 @@ def finish_oauth(db: Session, user: User, full_callback_url: str) -> CalendarAcc
     return acct
 
 
-def _build_creds(acct: CalendarAccount) -> Credentials:
-    creds = Credentials(
-        token=acct.access_token,
-        refresh_token=acct.refresh_token,
-        token_uri=acct.token_uri or GOOGLE_TOKEN_URI,
-        client_id=acct.client_id,
-        client_secret=acct.client_secret,
-        scopes=(acct.scope or "").split(),
-    )
-    if creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-    return creds
+CALENDAR_API = "https://www.googleapis.com/calendar/v3"
+REFRESH_AHEAD = timedelta(minutes=10)
+MAX_RETRIES = 3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_http: httpx.AsyncClient | None = None
+# One refresh in flight per account; concurrent callers wait and reuse the result.
+_refresh_locks: Dict[str, asyncio.Lock] = {}
+
+
+class CalendarApiError(RuntimeError):
+    def __init__(self, status: int, body: str):
+        super().__init__(f"Google Calendar API error {status}: {body[:300]}")
+        self.status = status
+
+
+def _client() -> httpx.AsyncClient:
+    """Process-wide pooled client shared by every account and the token endpoint."""
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            timeout=httpx.Timeout(15.0, connect=5.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            transport=httpx.AsyncHTTPTransport(retries=2),  # connect-level retries
+        )
+    return _http
+
+
+async def aclose_http() -> None:
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+
+def _needs_refresh(acct: CalendarAccount, ahead: timedelta = timedelta(0)) -> bool:
+    if not acct.refresh_token:
+        return False
+    if not acct.access_token or not acct.token_expiry:
+        return True
+    return acct.token_expiry - ahead <= datetime.utcnow()
+
+
+async def _refresh_and_persist(
+    db: Session,
+    acct: CalendarAccount,
+    ahead: timedelta = timedelta(0),
+    rejected_token: str | None = None,
+) -> bool:
+    """
+    Refresh the access token and write it back so other workers/restarts reuse it.
+    `rejected_token` forces a refresh unless the stored token already differs from it.
+    """
+    lock = _refresh_locks.setdefault(acct.id, asyncio.Lock())
+    async with lock:
+        db.refresh(acct)
+        if rejected_token is not None:
+            if acct.access_token != rejected_token:
+                return False
+        elif not _needs_refresh(acct, ahead):
+            return False  # someone else refreshed while we waited
+        resp = await _client().post(
+            acct.token_uri or GOOGLE_TOKEN_URI,
+            data={
+                "grant_type": "refresh_token",
+                "refresh_token": acct.refresh_token,
+                "client_id": acct.client_id,
+                "client_secret": acct.client_secret,
+            },
+        )
+        if resp.is_error:
+            raise CalendarApiError(resp.status_code, resp.text)
+        tok = resp.json()
+        acct.access_token = tok["access_token"]
+        acct.token_expiry = datetime.utcnow() + timedelta(seconds=int(tok.get("expires_in", 3600)))
+        acct.updated_at = datetime.utcnow()
+        db.commit()
+        return True
+
 
+class CalendarApi:
+    """Async Calendar v3 calls for one account over the shared pooled client."""
 
-def _service(acct: CalendarAccount):
-    creds = _build_creds(acct)
-    return build("calendar", "v3", credentials=creds, cache_discovery=False)
+    def __init__(self, db: Session, acct: CalendarAccount):
+        self.db = db
+        self.acct = acct
+
+    async def request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        """Send with retries on 429/5xx (honouring Retry-After) and one re-auth on 401."""
+        reauthed = False
+        for attempt in range(MAX_RETRIES + 1):
+            if _needs_refresh(self.acct):
+                await _refresh_and_persist(self.db, self.acct)
+            headers = {"Authorization": f"Bearer {self.acct.access_token}"}
+            try:
+                resp = await _client().request(
+                    method, CALENDAR_API + path, headers=headers, **kwargs
+                )
+            except httpx.TransportError:
+                if attempt == MAX_RETRIES:
+                    raise
+                await asyncio.sleep(0.5 * 2**attempt)
+                continue
+            if resp.status_code == 401 and not reauthed and self.acct.refresh_token:
+                reauthed = True
+                await _refresh_and_persist(
+                    self.db, self.acct, rejected_token=headers["Authorization"][7:]
+                )
+                continue
+            rate_limited = resp.status_code == 403 and "ateLimitExceeded" in resp.text
+            if (resp.status_code in RETRY_STATUSES or rate_limited) and attempt < MAX_RETRIES:
+                retry_after = resp.headers.get("Retry-After", "")
+                delay = float(retry_after) if retry_after.isdigit() else 0.5 * 2**attempt
+                await asyncio.sleep(min(delay, 10.0))
+                continue
+            if resp.is_error:
+                raise CalendarApiError(resp.status_code, resp.text)
+            return resp.json() if resp.content else {}
+        raise CalendarApiError(resp.status_code, resp.text)
+
+    async def list_pages(self, **params) -> tuple[List[Dict[str, Any]], str | None]:
+        """Collect items across all pages; returns (items, nextSyncToken from the last page)."""
+        items, page_token = [], None
+        while True:
+            q = {**params, **({"pageToken": page_token} if page_token else {})}
+            resp = await self.request("GET", "/calendars/primary/events", params=q)
+            items.extend(resp.get("items", []))
+            page_token = resp.get("nextPageToken")
+            if not page_token:
+                return items, resp.get("nextSyncToken")
+
+
+def _service(db: Session, acct: CalendarAccount) -> CalendarApi:
+    return CalendarApi(db, acct)
+
+
+async def refresh_expiring_tokens(ahead: timedelta = REFRESH_AHEAD) -> int:
+    """Renew every account token that expires within `ahead`. Run periodically."""
+    db = SessionLocal()
+    refreshed = 0
+    try:
+        accts = (
+            db.query(CalendarAccount)
+            .filter(
+                CalendarAccount.revoked == False,  # noqa: E712
+                CalendarAccount.refresh_token.isnot(None),
+                (CalendarAccount.token_expiry.is_(None))
+                | (CalendarAccount.token_expiry <= datetime.utcnow() + ahead),
+            )
+            .all()
+        )
+        results = await asyncio.gather(
+            *(_refresh_and_persist(db, a, ahead) for a in accts), return_exceptions=True
+        )
+        for acct, res in zip(accts, results):
+            if isinstance(res, Exception):
+                print(f"Token refresh failed for calendar account {acct.id}:", repr(res))
+            elif res:
+                refreshed += 1
+    finally:
+        db.close()
+    return refreshed
 
 
 def _iso_to_dt(s: str):
@@ -112,7 +263,159 @@ def _iso_to_dt(s: str):
     return dateparse.parse(s)
 
 
-def sync_primary(db: Session, user: User, days_forward: int = 14) -> int:
+async def _fetch_changes(api: CalendarApi, sync_token: str | None, window: tuple[datetime, datetime]):
+    """Return (items, next_sync_token, was_full). Falls back to a full `window` pull on 410 GONE."""
+    if sync_token:
+        try:
+            items, next_token = await api.list_pages(singleEvents="true", syncToken=sync_token)
+            return items, next_token, False
+        except CalendarApiError as e:
+            if e.status != 410:
+                raise
+            # Token expired/invalidated by Google: start over with a full sync.
+    items, next_token = await api.list_pages(
+        singleEvents="true",
+        timeMin=window[0].isoformat(),
+        timeMax=window[1].isoformat(),
+    )
+    return items, next_token, True
+
+
+def _sync_window(tz: str, days_forward: int) -> tuple[datetime, datetime]:
+    """[timeMin, timeMax) of a full pull, aware in the user's timezone (the zone stored starts are in)."""
+    start = now_tz(tz).replace(second=0, microsecond=0)
+    return start, start + timedelta(days=days_forward)
+
+
+EVENT_CHUNK = 500
+_COMPARED = ("summary", "location", "start", "end", "status")
+
+
+def _naive(dt: datetime | None) -> datetime | None:
+    # DateTime columns come back naive; compare on wall-clock values.
+    return dt.replace(tzinfo=None) if dt is not None else None
+
+
+def _event_row(user_id: str, it: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "provider": "google",
+        "external_id": it["id"],
+        "summary": it.get("summary"),
+        "location": it.get("location"),
+        "start": _iso_to_dt(
+            it.get("start", {}).get("dateTime") or it.get("start", {}).get("date")
+        ),
+        "end": _iso_to_dt(
+            it.get("end", {}).get("dateTime") or it.get("end", {}).get("date")
+        ),
+        "status": it.get("status"),
+        "activity": activity.categorize(it.get("summary")),
+        "raw": it,
+    }
+
+
+def _unchanged(row: Dict[str, Any], existing) -> bool:
+    for col in _COMPARED:
+        new, old = row[col], getattr(existing, col)
+        if col in ("start", "end"):
+            new, old = _naive(new), _naive(old)
+        if new != old:
+            return False
+    old_etag = (existing.raw or {}).get("etag")
+    return old_etag is None or old_etag == row["raw"].get("etag")
+
+
+def _write_rows(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """INSERT ... ON CONFLICT (user_id, external_id) DO UPDATE where the dialect has it."""
+    now = datetime.utcnow()
+    existing_ids = [r.pop("_existing", None) for r in rows]
+    for r in rows:
+        r["updated_at"] = now
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        mod = sqlite_dialect if dialect == "sqlite" else pg_dialect
+        stmt = mod.insert(Event).values([{**r, "id": gen_id()} for r in rows])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "external_id"],
+            set_={
+                c: stmt.excluded[c]
+                for c in ("summary", "location", "start", "end", "status", "activity", "raw", "updated_at")
+            },
+        )
+        db.execute(stmt)
+        return
+    # Generic fallback: one executemany for inserts, one for updates by primary key.
+    inserts = [{**r, "id": gen_id()} for r, pk in zip(rows, existing_ids) if pk is None]
+    updates = [{**r, "id": pk} for r, pk in zip(rows, existing_ids) if pk is not None]
+    if inserts:
+        db.execute(insert(Event), inserts)
+    if updates:
+        db.execute(update(Event), updates)
+
+
+def upsert_events(
+    db: Session, user_id: str, items: List[Dict[str, Any]], chunk_size: int = EVENT_CHUNK
+) -> Dict[str, int]:
+    """
+    Bulk-ingest Google event items: per chunk, one SELECT of the matching rows,
+    one upsert for new/changed events and one DELETE for cancellations.
+    Does not commit.
+    """
+    stats = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+    # Later items win if Google repeats an id across pages.
+    by_id = {it["id"]: it for it in items}
+    ids = list(by_id)
+    for i in range(0, len(ids), chunk_size):
+        chunk = [by_id[eid] for eid in ids[i : i + chunk_size]]
+        cancelled = [it["id"] for it in chunk if it.get("status") == "cancelled"]
+        live = [_event_row(user_id, it) for it in chunk if it.get("status") != "cancelled"]
+
+        if cancelled:
+            stats["deleted"] += (
+                db.query(Event)
+                .filter(Event.user_id == user_id, Event.external_id.in_(cancelled))
+                .delete(synchronize_session=False)
+            )
+        if not live:
+            continue
+
+        existing = {
+            e.external_id: e
+            for e in db.query(Event).filter(
+                Event.user_id == user_id,
+                Event.external_id.in_([r["external_id"] for r in live]),
+            )
+        }
+        to_write = []
+        for row in live:
+            old = existing.get(row["external_id"])
+            if old is None:
+                stats["inserted"] += 1
+            elif _unchanged(row, old):
+                stats["unchanged"] += 1
+                continue
+            else:
+                stats["updated"] += 1
+                row["_existing"] = old.id
+            to_write.append(row)
+        if to_write:
+            _write_rows(db, to_write)
+        # Rows were written behind the ORM's back; reload on next access.
+        for e in existing.values():
+            db.expire(e)
+    if stats["inserted"] or stats["updated"] or stats["deleted"]:
+        activity.refresh_rollup(db, user_id)
+    return stats
+
+
+async def sync_primary(
+    db: Session, user: User, days_forward: int = 14, full: bool = False
+) -> Dict[str, Any]:
+    """
+    Incremental sync: with a stored syncToken only deltas are fetched (all pages),
+    cancelled events are deleted; `full=True` or an expired token re-pulls the window.
+    """
     acct = (
         db.query(CalendarAccount)
         .filter_by(user_id=user.id, provider="google")
@@ -120,62 +423,39 @@ def sync_primary(db: Session, user: User, days_forward: int = 14) -> int:
     )
     if not acct:
         raise RuntimeError("No connected Google Calendar account")
-    svc = _service(acct)
-
-    now = datetime.utcnow().isoformat() + "Z"
-    time_max = (datetime.utcnow() + timedelta(days=days_forward)).isoformat() + "Z"
-    events_result = (
-        svc.events()
-        .list(
-            calendarId="primary",
-            timeMin=now,
-            timeMax=time_max,
-            singleEvents=True,
-            orderBy="startTime",
-        )
-        .execute()
+    api = _service(db, acct)
+
+    meta = dict(acct.meta or {})
+    window = _sync_window(user.tz, days_forward)
+    items, next_token, was_full = await _fetch_changes(
+        api, None if full else meta.get("sync_token"), window
     )
-    items = events_result.get("items", [])
-    count = 0
-    for it in items:
-        eid = it["id"]
-        start = _iso_to_dt(
-            it.get("start", {}).get("dateTime") or it.get("start", {}).get("date")
-        )
-        end = _iso_to_dt(
-            it.get("end", {}).get("dateTime") or it.get("end", {}).get("date")
-        )
-        ev = (
-            db.query(Event)
-            .filter_by(user_id=user.id, provider="google", external_id=eid)
-            .one_or_none()
-        )
-        if not ev:
-            ev = Event(
-                user_id=user.id,
-                provider="google",
-                external_id=eid,
-                summary=it.get("summary"),
-                location=it.get("location"),
-                start=start,
-                end=end,
-                status=it.get("status"),
-                raw=it,
-            )
-            db.add(ev)
-        else:
-            ev.summary = it.get("summary")
-            ev.location = it.get("location")
-            ev.start = start
-            ev.end = end
-            ev.status = it.get("status")
-            ev.raw = it
-        count += 1
+    stats = upsert_events(db, user.id, items)
+    if was_full:
+        # A full pull is authoritative only for the window it fetched: drop rows
+        # starting inside [timeMin, timeMax) that Google no longer returns. Starts
+        # are stored as naive local wall-clock, like day_bounds() compares them.
+        seen = [it["id"] for it in items if it.get("status") != "cancelled"]
+        db.query(Event).filter(
+            Event.user_id == user.id,
+            Event.provider == "google",
+            Event.start >= _naive(window[0]),
+            Event.start < _naive(window[1]),
+            Event.external_id.notin_(seen),
+        ).delete(synchronize_session=False)
+        activity.refresh_rollup(db, user.id)
+
+    # Reassign (not mutate) so the JSON column is flagged dirty.
+    meta["sync_token"] = next_token
+    meta["last_sync"] = datetime.utcnow().isoformat()
+    meta["last_sync_mode"] = "full" if was_full else "incremental"
+    acct.meta = meta
     db.commit()
-    return count
+    stats["mode"] = meta["last_sync_mode"]
+    return stats
 
 
-def create_event(
+async def create_event(
     db: Session,
     user: User,
     summary: str,
@@ -190,7 +470,7 @@ def create_event(
     )
     if not acct:
         raise RuntimeError("No connected Google Calendar account")
-    svc = _service(acct)
+    api = _service(db, acct)
     body = {
         "summary": summary,
         "start": {"dateTime": start_iso},
@@ -198,7 +478,7 @@ def create_event(
     }
     if location:
         body["location"] = location
-    resp = svc.events().insert(calendarId="primary", body=body).execute()
+    resp = await api.request("POST", "/calendars/primary/events", json=body)
     ev = Event(
         user_id=user.id,
         provider="google",
@@ -208,15 +488,20 @@ def create_event(
         start=_iso_to_dt(resp["start"].get("dateTime") or resp["start"].get("date")),
         end=_iso_to_dt(resp["end"].get("dateTime") or resp["end"].get("date")),
         status=resp.get("status"),
+        activity=activity.categorize(resp.get("summary")),
         raw=resp,
     )
     db.add(ev)
+    if ev.activity:
+        activity.refresh_rollup(db, user.id, activity.categories(ev.activity))
     db.commit()
     db.refresh(ev)
     return ev
 
 
-def update_event(db: Session, user: User, external_id: str, patch: Dict) -> Event:
+async def update_event(
+    db: Session, user: User, external_id: str, patch: Dict
+) -> Event:
     acct = (
         db.query(CalendarAccount)
         .filter_by(user_id=user.id, provider="google")
@@ -224,11 +509,9 @@ def update_event(db: Session, user: User, external_id: str, patch: Dict) -> Even
     )
     if not acct:
         raise RuntimeError("No connected Google Calendar account")
-    svc = _service(acct)
-    resp = (
-        svc.events()
-        .patch(calendarId="primary", eventId=external_id, body=patch)
-        .execute()
+    api = _service(db, acct)
+    resp = await api.request(
+        "PATCH", f"/calendars/primary/events/{quote(external_id, safe='')}", json=patch
     )
     ev = (
         db.query(Event)
@@ -243,7 +526,11 @@ def update_event(db: Session, user: User, external_id: str, patch: Dict) -> Even
     ev.start = _iso_to_dt(resp["start"].get("dateTime") or resp["start"].get("date"))
     ev.end = _iso_to_dt(resp["end"].get("dateTime") or resp["end"].get("date"))
     ev.status = resp.get("status")
+    old_activity, ev.activity = ev.activity, activity.categorize(resp.get("summary"))
     ev.raw = resp
+    touched = set(activity.categories(old_activity)) | set(activity.categories(ev.activity))
+    if touched:
+        activity.refresh_rollup(db, user.id, touched)
     db.commit()
     db.refresh(ev)
     return ev
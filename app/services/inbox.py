@@ -0,0 +1,87 @@
+"""Inbox ingestion: classify, hash and bulk-insert messages idempotently."""
+import hashlib
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql as pg_dialect, sqlite as sqlite_dialect
+from sqlalchemy.orm import Session
+
+from app.models.common import gen_id, now_utc
+from app.models.message import Message
+from app.services import intent
+
+# Rows per executemany; bounds memory per round-trip on very large backfills.
+INSERT_CHUNK = 500
+
+
+def message_hash(payload: Dict[str, Any]) -> str:
+    """sha256 of the body (the relay's replay key); header fields when the body is empty."""
+    body = payload.get("body") or ""
+    if not body:
+        body = "\n".join(str(payload.get(k) or "") for k in ("channel", "from", "subject"))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _row(db: Session, user_id: str, payload: Dict[str, Any], body_hash: str) -> Dict[str, Any]:
+    subject, body = payload.get("subject"), payload.get("body")
+    channel = payload.get("channel", "email")
+    return {
+        "id": gen_id(),
+        "user_id": user_id,
+        "ts": now_utc(),
+        "channel": channel,
+        "from_addr": payload.get("from"),
+        "subject": subject,
+        "body_hash": body_hash,
+        "intent": intent.classify(subject, body, db, user_id, channel).intent,
+        "data": payload,
+    }
+
+
+def _insert_ignore(db: Session, rows: List[Dict[str, Any]]) -> int:
+    """INSERT ... ON CONFLICT (user_id, body_hash) DO NOTHING; returns rows inserted."""
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        mod = sqlite_dialect if dialect == "sqlite" else pg_dialect
+        stmt = mod.insert(Message).on_conflict_do_nothing(index_elements=["user_id", "body_hash"])
+        # executemany: the statement compiles once instead of per multi-VALUES chunk.
+        return db.connection().execute(stmt, rows).rowcount
+    # Generic fallback: filter out hashes already stored, then one executemany.
+    seen = set(
+        db.scalars(
+            select(Message.body_hash).where(
+                Message.user_id == rows[0]["user_id"],
+                Message.body_hash.in_([r["body_hash"] for r in rows]),
+            )
+        )
+    )
+    fresh = [r for r in rows if r["body_hash"] not in seen]
+    if fresh:
+        db.execute(insert(Message), fresh)
+    return len(fresh)
+
+
+def ingest_messages(
+    db: Session, user_id: str, payloads: Iterable[Dict[str, Any]], chunk_size: int = INSERT_CHUNK
+) -> Dict[str, Any]:
+    """
+    Classify and insert a batch in one transaction. Messages whose
+    (user_id, body_hash) already exists, in the DB or earlier in the batch,
+    are counted as duplicates and skipped. Commits.
+    """
+    by_hash: Dict[str, Dict[str, Any]] = {}
+    received = 0
+    for p in payloads:
+        received += 1
+        by_hash.setdefault(message_hash(p), p)
+    rows = [_row(db, user_id, p, h) for h, p in by_hash.items()]
+
+    accepted = 0
+    try:
+        for i in range(0, len(rows), chunk_size):
+            accepted += _insert_ignore(db, rows[i : i + chunk_size])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {"received": received, "accepted": accepted, "duplicates": received - accepted}
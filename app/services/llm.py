@@ -0,0 +1,85 @@
+"""
+Shared Anthropic Messages client for the planner and the inbox extraction
+stage: one AsyncAnthropic (and connection pool), a cacheable system prefix,
+forced-tool structured output and per-call token accounting.
+"""
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from anthropic import AsyncAnthropic
+
+from app.core.config import settings
+from app.services import llm_context
+
+MODEL_ID = "claude-3-5-sonnet-20240620"
+
+# Per-call token accounting, newest last (see /v1/plan/usage).
+llm_usage: deque = deque(maxlen=200)
+
+_client: Optional[AsyncAnthropic] = None
+
+
+def client() -> AsyncAnthropic:
+    """One client (and connection pool) for every planner/extraction call."""
+    global _client
+    if _client is None:
+        _client = AsyncAnthropic(api_key=settings.anthropic_key)
+    return _client
+
+
+def _cached_system(text: str) -> List[Dict[str, Any]]:
+    # Static instructions + schema form the prompt prefix; let the provider cache it.
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+
+async def create(
+    kind: str,
+    system: str,
+    body: Any,
+    max_tokens: int,
+    temperature: float,
+    stats: Dict[str, int] | None = None,
+    user_id: str | None = None,
+    tool: Dict[str, Any] | None = None,
+):
+    """One Messages call with a cacheable system prefix; records token usage.
+
+    With `tool`, the model is forced to answer through it (structured output).
+    """
+    kwargs: Dict[str, Any] = {}
+    if tool:
+        kwargs = {"tools": [tool], "tool_choice": {"type": "tool", "name": tool["name"]}}
+    t0 = time.perf_counter()
+    resp = await client().messages.create(
+        model=MODEL_ID,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        system=_cached_system(system),
+        messages=[{"role": "user", "content": llm_context.dumps(body)}],
+        **kwargs,
+    )
+    usage = resp.usage
+    llm_usage.append(
+        {
+            "at": datetime.utcnow().isoformat(),
+            "kind": kind,
+            "userId": user_id,
+            "latencyMs": round((time.perf_counter() - t0) * 1000, 1),
+            "promptTokens": usage.input_tokens,
+            "cachedTokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+            "cacheWriteTokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+            "outputTokens": usage.output_tokens,
+            **({"context": stats} if stats else {}),
+        }
+    )
+    return resp
+
+
+def tool_input(resp, name: str) -> Dict[str, Any]:
+    """Input of the `name` tool call in a forced-tool response ({} if absent)."""
+    for b in resp.content:
+        if getattr(b, "type", "") == "tool_use" and b.name == name:
+            return dict(b.input or {})
+    return {}
@@ -0,0 +1,121 @@
+"""
+Token-budgeted, compact planner context for the LLM.
+
+`build_context` returns everything the solver might need; the model only needs
+the most relevant slice. Tasks and goals are ranked, long strings are clipped,
+rows are encoded as positional arrays (field names are described once in the
+static system prompt), and the lowest-ranked rows are dropped until the
+estimated size fits `settings.planner_context_tokens`.
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+from app.core.config import settings
+from app.core.time import now_tz
+
+# Described to the model in planner.SYSTEM; keep the two in sync.
+TASK_FIELDS = ["title", "pillar", "impact", "due"]
+GOAL_FIELDS = ["horizon", "text", "metric", "target"]
+EVENT_FIELDS = ["start", "end", "title", "location"]
+STRESSOR_FIELDS = ["trigger", "coping"]
+
+MAX_TEXT = 80
+MAX_STRESSORS = 5
+CHARS_PER_TOKEN = 4  # rough estimate for English + JSON; no tokenizer round-trip
+
+
+def estimate_tokens(obj: Any) -> int:
+    text = obj if isinstance(obj, str) else dumps(obj)
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _clip(s: Any) -> Any:
+    if isinstance(s, str) and len(s) > MAX_TEXT:
+        return s[: MAX_TEXT - 1] + "…"
+    return s
+
+
+def _short_dt(iso: str | None, fmt: str) -> str | None:
+    if not iso:
+        return None
+    try:
+        return datetime.fromisoformat(iso).strftime(fmt)
+    except ValueError:
+        return iso
+
+
+def _task_rank(t: Dict[str, Any], today: datetime) -> Tuple:
+    due = t.get("dueAt")
+    days = None
+    if due:
+        try:
+            days = (datetime.fromisoformat(due).replace(tzinfo=None) - today).days
+        except ValueError:
+            pass
+    # Overdue/soon first, then impact; undated tasks rank on impact alone.
+    urgency = 0 if days is None else max(0, 7 - days)
+    return (-(int(t.get("impact") or 1) * 2 + urgency), days if days is not None else 999)
+
+
+def _goal_rank(g: Dict[str, Any], task_words: set) -> Tuple:
+    horizon = (g.get("horizon") or "").lower()
+    short = horizon.startswith("short") or horizon in ("14d", "90d")
+    words = set((g.get("text") or "").lower().split())
+    return (0 if short else 1, -len(words & task_words))
+
+
+def compact(context: Dict[str, Any], budget: int | None = None) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """Return (compact context, stats). Events and free windows are never trimmed."""
+    budget = budget or settings.planner_context_tokens
+    tz = context.get("identity", {}).get("tz") or settings.default_tz
+    # Midnight in the user's zone, naive like the stored dueAt wall-clock times.
+    today = now_tz(tz).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+    tasks = sorted(context.get("tasks", []), key=lambda t: _task_rank(t, today))
+    task_words = {w for t in tasks[:10] for w in (t.get("title") or "").lower().split()}
+    goals = sorted(context.get("goals", []), key=lambda g: _goal_rank(g, task_words))
+
+    out: Dict[str, Any] = {
+        "tz": tz,
+        "events": [
+            [_short_dt(e.get("start"), "%H:%M"), _short_dt(e.get("end"), "%H:%M"), _clip(e.get("title")), _clip(e.get("location"))]
+            for e in context.get("events", [])
+        ],
+        "free": [f"{w['start']}-{w['end']}" for w in context.get("free", [])],
+        "stressors": [
+            [_clip(s.get("trigger")), _clip(s.get("coping"))]
+            for s in context.get("stressors", [])[:MAX_STRESSORS]
+        ],
+        "tasks": [
+            [_clip(t.get("title")), (t.get("pillar") or "")[:1] or None, t.get("impact"), _short_dt(t.get("dueAt"), "%m-%d %H:%M")]
+            for t in tasks
+        ],
+        "goals": [
+            [g.get("horizon"), _clip(g.get("text")), _clip(g.get("metric")), g.get("target")]
+            for g in goals
+        ],
+    }
+
+    original = estimate_tokens(context)
+    # Drop from the tail of whichever list is longer, keeping at least a few of each.
+    while estimate_tokens(out) > budget and (len(out["tasks"]) > 3 or len(out["goals"]) > 2):
+        if len(out["tasks"]) > 3 and (len(out["tasks"]) >= 2 * len(out["goals"]) or len(out["goals"]) <= 2):
+            out["tasks"].pop()
+        else:
+            out["goals"].pop()
+
+    stats = {
+        "original_tokens": original,
+        "context_tokens": estimate_tokens(out),
+        "budget": budget,
+        "tasks_kept": len(out["tasks"]),
+        "tasks_dropped": len(tasks) - len(out["tasks"]),
+        "goals_kept": len(out["goals"]),
+        "goals_dropped": len(goals) - len(out["goals"]),
+    }
+    return out, stats
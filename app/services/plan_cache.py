@@ -0,0 +1,163 @@
+"""Content-addressed cache for generated plans (TTL + LRU, memory or SQLite backend)."""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+
+
+def context_key(context: Dict[str, Any], *salt: Any) -> str:
+    """Stable sha256 over the planner context (key order independent)."""
+    blob = json.dumps([context, *salt], sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class MemoryBackend:
+    def __init__(self, ttl_s: float, max_entries: int):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple[float, str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            hit = self._data.get(key)
+            if not hit:
+                return None
+            expires_at, _user_id, value = hit
+            if expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any, user_id: str) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl_s, user_id, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate_user(self, user_id: str) -> None:
+        with self._lock:
+            for k in [k for k, v in self._data.items() if v[1] == user_id]:
+                del self._data[k]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteBackend:
+    def __init__(self, path: str, ttl_s: float, max_entries: int):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS plan_cache (
+                key TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_plan_cache_user ON plan_cache (user_id);
+            CREATE INDEX IF NOT EXISTS ix_plan_cache_access ON plan_cache (last_access);
+            """
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM plan_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM plan_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE plan_cache SET last_access = ? WHERE key = ?", (now, key)
+            )
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any, user_id: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO plan_cache VALUES (?, ?, ?, ?, ?)",
+                (key, user_id, json.dumps(value, default=str), now + self.ttl_s, now),
+            )
+            self._conn.execute("DELETE FROM plan_cache WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM plan_cache WHERE key IN ("
+                " SELECT key FROM plan_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def invalidate_user(self, user_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM plan_cache WHERE user_id = ?", (user_id,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM plan_cache")
+
+
+class PlanCache:
+    """Thin front over a backend that also counts hits and misses."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        if self.backend is None:
+            return None
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any, user_id: str) -> None:
+        if self.backend is not None:
+            self.backend.put(key, value, user_id)
+
+    def invalidate_user(self, user_id: str) -> None:
+        if self.backend is not None:
+            self.backend.invalidate_user(user_id)
+
+    def clear(self) -> None:
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def _make_backend():
+    kind = settings.plan_cache_backend
+    if kind == "sqlite":
+        return SQLiteBackend(
+            settings.plan_cache_path, settings.plan_cache_ttl_s, settings.plan_cache_max
+        )
+    if kind == "memory":
+        return MemoryBackend(settings.plan_cache_ttl_s, settings.plan_cache_max)
+    return None  # "off"
+
+
+plan_cache = PlanCache(_make_backend())
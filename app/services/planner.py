@@ -1,98 +1,353 @@
-import json
-from typing import Dict, Any
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, Any, Iterable, List, Optional, Type
 
-from strands import Agent
-from strands.models.anthropic import (
-    AnthropicModel,
-)  # pip install 'strands-agents[anthropic]'
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.orm import Session
 
-from app.schemas.plan import PlanPayload
+from app.schemas.plan import PlanPayload, PlanProse
 from app.core.config import settings
+from app.core.time import day_bounds, now_tz
+from app.models.user import User
+from app.models.task import Task
+from app.models.goal import Goal
+from app.models.stressor import Stressor
+from app.models.event import Event
+from app.models.plan import Plan
+from app.services.plan_cache import plan_cache, context_key
+from app.services import versions
+from app.services import freebusy, solver, llm_context
+from app.services.llm import create, tool_input
 
 SYSTEM = (
-    "You are a precise executive assistant. Respond with STRICT JSON ONLY matching this schema: "
-    '{"eisenhower":{"urgent_important":[],"urgent_not_important":[],"not_urgent_important":[],"not_urgent_not_important":[]},'
-    '"three_needles":{"money":"","health":"","relationships":""},'
-    '"schedule":[{"start":"HH:mm","end":"HH:mm","item":""}],'
-    '"affirmations":{"am":"","pm":""},'
-    '"stress_guide":[{"trigger":"","action":""}],'
-    '"nudges":[{"at":"HH:mm","msg":""}]} '
-    "Rules: honor user timezone and events; prefer 06:30–21:00 unless events force otherwise. "
-    "Do not include any text outside the JSON."
+    "You are a precise executive assistant. Deliver the day plan by calling the submit_plan tool. "
+    "three_needles keys: money, health, relationships. affirmations keys: am, pm. "
+    "Times are HH:mm; nudges are {\"at\":\"HH:mm\",\"msg\":\"\"}. "
+    "Rules: honor user timezone and events; place schedule blocks inside the context's `free` windows; prefer 06:30–21:00 unless events force otherwise. "
+    "The context is compact JSON: rows are arrays, most relevant first. "
+    f"tasks={llm_context.TASK_FIELDS} (pillar is its initial: M=Money H=Health R=Relationships W=Work P=Personal; due is MM-dd HH:mm), "
+    f"goals={llm_context.GOAL_FIELDS}, events={llm_context.EVENT_FIELDS} (HH:mm today), "
+    f"stressors={llm_context.STRESSOR_FIELDS}, free=[\"HH:mm-HH:mm\"]."
 )
 
+# Structured-output outcomes: calls, parse_failures, repairs, repaired, fallbacks
+# (prose_* for the hybrid engine's wording pass).
+plan_stats: Counter = Counter()
 
-async def call_claude(context: Dict[str, Any]) -> PlanPayload:
-    """Use the same Strands+Anthropic stack as chat. Fall back locally on any error."""
+PLAN_TOOL = {
+    "name": "submit_plan",
+    "description": "Submit today's plan.",
+    "input_schema": PlanPayload.model_json_schema(),
+    # Tools precede the system prompt in the cached prefix.
+    "cache_control": {"type": "ephemeral"},
+}
+
+
+def _invalid_fields(err: ValidationError) -> List[str]:
+    return sorted({str(e["loc"][0]) for e in err.errors() if e.get("loc")})
+
+
+def _field_tool(fields: List[str], model: Type[BaseModel] = PlanPayload) -> Dict[str, Any]:
+    """The submit tool's schema narrowed to just `fields`, for the repair round-trip."""
+    full = model.model_json_schema()
+    schema: Dict[str, Any] = {
+        "type": "object",
+        "properties": {f: full["properties"][f] for f in fields},
+        "required": fields,
+    }
+    if "$defs" in full:
+        schema["$defs"] = full["$defs"]
+    return {"name": "submit_fields", "description": "Resubmit only these fields.", "input_schema": schema}
+
+
+PLAN_TASK_LIMIT = 50
+
+
+def open_tasks(db: Session, user_id: str, limit: int = PLAN_TASK_LIMIT) -> List[Task]:
+    return (
+        db.query(Task)
+        .filter(Task.user_id == user_id, Task.status == "open")
+        .order_by(Task.impact.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def today_events(db: Session, user: User) -> List[Event]:
+    start, end = day_bounds(user.tz)
+    return (
+        db.query(Event)
+        .filter(Event.user_id == user.id, Event.start >= start, Event.end <= end)
+        .order_by(Event.start.asc())
+        .all()
+    )
+
+
+def build_context(db: Session, user: User) -> Dict[str, Any]:
+    """Collect the user's open tasks, goals, stressors and today's events for the planner."""
+    return context_from_rows(
+        user,
+        open_tasks(db, user.id),
+        db.query(Goal).filter(Goal.user_id == user.id).all(),
+        db.query(Stressor).filter(Stressor.user_id == user.id).all(),
+        today_events(db, user),
+    )
+
+
+def context_from_rows(
+    user: User,
+    tasks: List[Task],
+    goals: List[Goal],
+    stressors: List[Stressor],
+    events: List[Event],
+) -> Dict[str, Any]:
+    """Planner context from rows the caller already loaded (see agent_chat.ToolTurn)."""
+    start, _ = day_bounds(user.tz)
+    # Real open time today (06:30-21:00 planning window) so the planner stops guessing.
+    day = start.replace(tzinfo=None)
+    busy = freebusy.bitmap(
+        ((e.start.replace(tzinfo=None), e.end.replace(tzinfo=None)) for e in events if e.start and e.end),
+        day,
+        day + timedelta(days=1),
+    )
+    awake = freebusy.working_hours_mask(day, day + timedelta(days=1), 6, 21, weekdays=range(7))
+    awake[: 6 * 60 + 30] = False
+    free = freebusy.free_windows(busy, day, min_minutes=15, mask=awake)
+
+    return {
+        "identity": {"name": "You", "tz": user.tz},
+        "tasks": [
+            {
+                "title": t.title,
+                "pillar": t.pillar,
+                "impact": t.impact,
+                "dueAt": t.due_at.isoformat() if t.due_at else None,
+            }
+            for t in tasks
+        ],
+        "goals": [
+            {
+                "horizon": g.horizon,
+                "text": g.text,
+                "metric": g.metric,
+                "target": g.target,
+            }
+            for g in goals
+        ],
+        "stressors": [
+            {"trigger": s.trigger, "pattern": s.pattern, "coping": s.coping}
+            for s in stressors
+        ],
+        "events": [
+            {
+                "title": e.summary,
+                "start": e.start.isoformat() if e.start else None,
+                "end": e.end.isoformat() if e.end else None,
+                "location": e.location,
+            }
+            for e in events
+        ],
+        "free": [{"start": f"{s:%H:%M}", "end": f"{e:%H:%M}"} for s, e in free],
+    }
+
+
+ENGINES = ("local", "llm", "hybrid")
+
+
+async def plan_for_user(
+    db: Session,
+    user: User,
+    engine: str | None = None,
+    context: Dict[str, Any] | None = None,
+) -> Dict[str, Any]:
+    """Build the context for one user and return the plan as plain dicts.
+
+    engine: "local" = solver only, "llm" = model plan, "hybrid" = solver schedule
+    with model-written affirmations/needles. Identical context on the same local
+    day reuses the cached model output. Pass `context` to skip the DB reads.
+    """
+    engine = engine or settings.planner_engine
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {', '.join(ENGINES)}")
+    if context is None:
+        context = build_context(db, user)
+    today = now_tz(user.tz).date()
+    if engine == "local":
+        payload = local_plan(context)
+    elif engine == "hybrid":
+        payload = local_plan(context)
+        key = context_key(context, today, "prose")
+        prose = await call_claude_prose(context, payload, cache_key=key, user_id=user.id)
+        payload.affirmations = prose.get("affirmations") or payload.affirmations
+        payload.three_needles = prose.get("three_needles") or payload.three_needles
+    else:
+        key = context_key(context, today)
+        payload = await call_claude(context, cache_key=key, user_id=user.id)
+    return {
+        "eisenhower": payload.eisenhower.model_dump(),
+        "schedule": [s.model_dump() for s in payload.schedule],
+        "affirmations": payload.affirmations,
+        "three_needles": payload.three_needles,
+        "stress_guide": [r.model_dump() for r in payload.stress_guide],
+        "nudges": payload.nudges,
+    }
+
+
+def save_plan(
+    db: Session, user: User, payload: Dict[str, Any], extra_nudges: Iterable = ()
+) -> Plan:
+    """Upsert today's saved plan for the user (one row per user per local day)."""
+    start, end = day_bounds(user.tz)
+    plan = (
+        db.query(Plan)
+        .filter(Plan.user_id == user.id, Plan.date >= start, Plan.date <= end)
+        .one_or_none()
+    )
+    if not plan:
+        plan = Plan(user_id=user.id, date=start)
+        db.add(plan)
+    plan.matrix = payload["eisenhower"]
+    plan.schedule = payload["schedule"]
+    plan.affirmations = payload.get("affirmations", {})
+    plan.needles = payload.get("three_needles", {})
+    plan.stress_guide = payload.get("stress_guide", [])
+    plan.nudges = payload.get("nudges", []) + list(extra_nudges)
+    versions.bump(db, user.id, "plan")
+    db.commit()
+    db.refresh(plan)
+    return plan
+
+
+async def call_claude(
+    context: Dict[str, Any], cache_key: str | None = None, user_id: str | None = None
+) -> PlanPayload:
+    """Ask the model for a plan from the token-budgeted context. Fall back locally on any error.
+
+    With a `cache_key`, a cached plan is returned without calling the model and
+    successful model plans are stored (fallback plans never are).
+    """
     if not settings.anthropic_key:
         return local_plan(context)
 
+    if cache_key:
+        cached = plan_cache.get(cache_key)
+        if cached is not None:
+            return PlanPayload.model_validate(cached)
+
+    plan_stats["calls"] += 1
     try:
-        model = AnthropicModel(
-            client_args={"api_key": settings.anthropic_key},
-            model_id="claude-3-5-sonnet-20240620",
-            max_tokens=1400,
-            params={"temperature": 0.4},
-        )
-        agent = Agent(model=model, system_prompt=SYSTEM)
-        # Pass just the context JSON; the system prompt defines the format.
-        result = await agent.invoke_async(json.dumps(context, default=str))
-        text = str(result).strip()
-
-        # Parse directly into your Pydantic schema. If it fails, use local fallback.
-        try:
-            return PlanPayload.model_validate_json(text)
-        except Exception:
-            # Some models wrap JSON in prose; try to extract the first {...}
-            import re
-
-            m = re.search(r"\{[\s\S]*\}", text)
-            if not m:
-                return local_plan(context)
-            return PlanPayload.model_validate_json(m.group(0))
+        compact, stats = llm_context.compact(context)
+        resp = await create("plan", SYSTEM, compact, 1400, 0.4, stats, user_id, tool=PLAN_TOOL)
+        data = tool_input(resp, PLAN_TOOL["name"])
+        payload = await _validate_or_repair(data, compact, user_id)
+        if payload is None:
+            plan_stats["fallbacks"] += 1
+            return local_plan(context)
+        if cache_key:
+            plan_cache.put(cache_key, payload.model_dump(), user_id)
+        return payload
     except Exception as e:
         # Any SDK/network/model error -> safe fallback
-        print("Planner (Strands) error:", repr(e))
+        print("Planner (Anthropic) error:", repr(e))
+        plan_stats["fallbacks"] += 1
         return local_plan(context)
 
 
-def local_plan(context: dict) -> PlanPayload:
-    """Deterministic plan so the UI never breaks."""
-    tasks = [t.get("title", "Task") for t in context.get("tasks", [])]
-    top = tasks[:4]
-    rest = tasks[4:8]
-    schedule = [
-        {"start": "06:45", "end": "07:00", "item": "Hydrate + plan review"},
-        {"start": "07:00", "end": "07:30", "item": "Meditation"},
-        {"start": "07:30", "end": "08:10", "item": "Skips/Yoga"},
-        {"start": "08:10", "end": "09:00", "item": "Deep Work Block #1"},
-    ]
-    nudges = [
-        {"at": "10:55", "msg": "Stand & water"},
-        {"at": "18:00", "msg": "Strength 30m"},
-    ]
-    return PlanPayload(
-        eisenhower={
-            "urgent_important": top[:2],
-            "urgent_not_important": rest[:2],
-            "not_urgent_important": top[2:4],
-            "not_urgent_not_important": rest[2:4],
-        },
-        three_needles={
-            "money": "Close one revenue/opportunity task",
-            "health": "500 skips + 3-mile walk",
-            "relationships": "Message a key friend",
-        },
-        schedule=schedule,
-        affirmations={
-            "am": "I move the big rocks first.",
-            "pm": "I celebrate progress, big or small.",
-        },
-        stress_guide=[
-            {
-                "trigger": "calendar overload",
-                "action": "Declutter + 3-min box breathing",
+async def _validate_or_repair(
+    data: Dict[str, Any],
+    compact: Dict[str, Any],
+    user_id: str | None,
+    model: Type[BaseModel] = PlanPayload,
+    system: str = SYSTEM,
+    stat: str = "",
+) -> Optional[BaseModel]:
+    """Validate tool output; re-ask only for invalid top-level fields, at most N times.
+
+    `stat` prefixes the plan_stats keys (e.g. "prose_")."""
+    for attempt in range(settings.planner_repair_attempts + 1):
+        try:
+            return model.model_validate(data)
+        except ValidationError as err:
+            if attempt == 0:
+                plan_stats[stat + "parse_failures"] += 1
+            if attempt == settings.planner_repair_attempts:
+                return None
+            fields = _invalid_fields(err) or list(model.model_fields)
+            plan_stats[stat + "repairs"] += 1
+            body = {
+                "context": compact,
+                "draft": {k: v for k, v in data.items() if k not in fields},
+                "errors": [
+                    {"field": ".".join(map(str, e["loc"])), "msg": e["msg"]} for e in err.errors()[:10]
+                ],
             }
-        ],
-        nudges=nudges,
-    )
+            tool = _field_tool(fields, model)
+            resp = await create("repair", system, body, 900, 0.2, None, user_id, tool=tool)
+            fixed = tool_input(resp, tool["name"])
+            data = {**data, **{k: fixed[k] for k in fields if k in fixed}}
+            try:
+                payload = model.model_validate(data)
+            except ValidationError:
+                continue
+            plan_stats[stat + "repaired"] += 1
+            return payload
+    return None
+
+
+PROSE_SYSTEM = (
+    "You write the motivational text for a day plan that is already scheduled. "
+    "Deliver it by calling the submit_prose tool. affirmations keys: am, pm. "
+    "three_needles keys: money, health, relationships. "
+    "Each needle is one short, concrete action drawn from the given tasks and schedule. "
+    f"tasks rows are {llm_context.TASK_FIELDS}, goals rows are {llm_context.GOAL_FIELDS}."
+)
+
+PROSE_TOOL = {
+    "name": "submit_prose",
+    "description": "Submit the affirmations and three needles for today's plan.",
+    "input_schema": PlanProse.model_json_schema(),
+    "cache_control": {"type": "ephemeral"},
+}
+
+
+async def call_claude_prose(
+    context: Dict[str, Any],
+    plan: PlanPayload,
+    cache_key: str | None = None,
+    user_id: str | None = None,
+) -> Dict[str, Any]:
+    """Affirmations and needle wording for a solver-built plan; {} when unavailable."""
+    if not settings.anthropic_key:
+        return {}
+    if cache_key:
+        cached = plan_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    plan_stats["prose_calls"] += 1
+    try:
+        compact, stats = llm_context.compact(context, budget=settings.planner_context_tokens // 2)
+        brief = {
+            "tasks": compact["tasks"][:15],
+            "goals": compact["goals"],
+            "schedule": [f"{s.start}-{s.end} {s.item}" for s in plan.schedule],
+        }
+        resp = await create("prose", PROSE_SYSTEM, brief, 400, 0.6, stats, user_id, tool=PROSE_TOOL)
+        data = tool_input(resp, PROSE_TOOL["name"])
+        prose = await _validate_or_repair(data, brief, user_id, PlanProse, PROSE_SYSTEM, "prose_")
+        if prose is None:
+            plan_stats["prose_fallbacks"] += 1
+            return {}
+        out = prose.model_dump()
+        if cache_key:
+            plan_cache.put(cache_key, out, user_id)
+        return out
+    except Exception as e:
+        print("Planner prose (Anthropic) error:", repr(e))
+        plan_stats["prose_fallbacks"] += 1
+        return {}
+
+
+def local_plan(context: dict) -> PlanPayload:
+    """Deterministic plan from the local solver, so the UI never breaks."""
+    tz = context.get("identity", {}).get("tz") or settings.default_tz
+    return solver.solve(context, now=now_tz(tz))
@@ -0,0 +1,142 @@
+"""In-process daily planning: one 07:00 cron per user timezone, fanned out on a worker pool."""
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.user import User
+from app.services import user_state
+from app.services.planner import plan_for_user, save_plan
+
+PLAN_HOUR = 7
+PLAN_MINUTE = 0
+
+# Summaries of the most recent bucket runs, newest last (see /v1/plan/runs).
+recent_runs: deque = deque(maxlen=50)
+
+
+@dataclass
+class PlanRunStats:
+    tz: str
+    started_at: datetime
+    users: int = 0
+    ok: int = 0
+    failed: int = 0
+    elapsed_s: float = 0.0
+    latencies_ms: List[float] = field(default_factory=list, repr=False)
+
+    def _pct(self, q: float) -> float:
+        if not self.latencies_ms:
+            return 0.0
+        xs = sorted(self.latencies_ms)
+        return round(xs[min(len(xs) - 1, int(q * len(xs)))], 1)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "tz": self.tz,
+            "startedAt": self.started_at.isoformat(),
+            "users": self.users,
+            "ok": self.ok,
+            "failed": self.failed,
+            "elapsedS": round(self.elapsed_s, 3),
+            "usersPerS": round(self.users / self.elapsed_s, 2) if self.elapsed_s else 0.0,
+            "p50Ms": self._pct(0.50),
+            "p95Ms": self._pct(0.95),
+            "maxMs": self._pct(1.0),
+        }
+
+
+async def _plan_one(user_id: str) -> None:
+    db = SessionLocal()
+    try:
+        user = db.get(User, user_id)
+        if not user:
+            return
+        payload = await plan_for_user(db, user)
+        # Same extra nudges /v1/plan/run adds from suggest_next_actions.
+        advice = user_state.next_actions(user_state.snapshot(db, user.id))["advice"]
+        save_plan(db, user, payload, advice)
+    finally:
+        db.close()
+
+
+async def run_bucket(
+    tz: str, user_ids: Optional[List[str]] = None, concurrency: Optional[int] = None
+) -> PlanRunStats:
+    """Plan and save today's plan for every user in `tz` with at most `concurrency` in flight."""
+    if user_ids is None:
+        db = SessionLocal()
+        try:
+            user_ids = [uid for (uid,) in db.query(User.id).filter(User.tz == tz).all()]
+        finally:
+            db.close()
+
+    stats = PlanRunStats(tz=tz, started_at=datetime.utcnow(), users=len(user_ids))
+    queue: asyncio.Queue = asyncio.Queue()
+    for uid in user_ids:
+        queue.put_nowait(uid)
+
+    async def worker():
+        while True:
+            try:
+                uid = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            t0 = time.perf_counter()
+            try:
+                await _plan_one(uid)
+                stats.ok += 1
+            except Exception as e:
+                stats.failed += 1
+                print(f"Planning failed for user {uid}:", repr(e))
+            stats.latencies_ms.append((time.perf_counter() - t0) * 1000)
+
+    n = max(1, min(concurrency or settings.plan_concurrency, len(user_ids) or 1))
+    t_start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(n)))
+    stats.elapsed_s = time.perf_counter() - t_start
+
+    summary = stats.summary()
+    recent_runs.append(summary)
+    print("Planning run:", summary)
+    return stats
+
+
+def timezone_buckets() -> Dict[str, int]:
+    """Distinct user timezones and how many users live in each."""
+    db = SessionLocal()
+    try:
+        rows = db.query(User.tz, func.count(User.id)).group_by(User.tz).all()
+    finally:
+        db.close()
+    return {tz: n for tz, n in rows if tz}
+
+
+def schedule_buckets(scheduler) -> List[str]:
+    """(Re)register one local-07:00 job per timezone; safe to call repeatedly."""
+    scheduled = []
+    for tz in timezone_buckets():
+        try:
+            ZoneInfo(tz)
+        except Exception:
+            print("Skipping invalid timezone:", tz)
+            continue
+        scheduler.add_job(
+            run_bucket,
+            CronTrigger(hour=PLAN_HOUR, minute=PLAN_MINUTE, timezone=tz),
+            args=[tz],
+            id=f"plan:{tz}",
+            replace_existing=True,
+            coalesce=True,
+            misfire_grace_time=3600,
+        )
+        scheduled.append(tz)
+    return scheduled
@@ -0,0 +1,194 @@
+"""
+Deterministic local planner: packs open tasks into the day's free time.
+
+Works purely on the planner context from `build_context` (tasks, events, free
+windows, stressors), so it needs no DB access and no model call. Priority is
+impact plus deadline pressure, with a penalty per block already given to the
+same pillar so one area cannot take the whole day.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.schemas.plan import PlanPayload
+
+DAY_START = (6, 30)
+DAY_END = (21, 0)
+MIN_BLOCK = 15  # minutes; shorter gaps are not worth scheduling
+BUFFER = 5  # minutes left free after each task block
+URGENT_DAYS = 2  # due within this many days (or overdue) counts as urgent
+IMPORTANT_IMPACT = 4
+PILLAR_PENALTY = 2.5
+NEEDLE_PILLARS = {"money": "Money", "health": "Health", "relationships": "Relationships"}
+DEFAULT_NEEDLES = {
+    "money": "Close one revenue/opportunity task",
+    "health": "500 skips + 3-mile walk",
+    "relationships": "Message a key friend",
+}
+DEFAULT_AFFIRMATIONS = {
+    "am": "I move the big rocks first.",
+    "pm": "I celebrate progress, big or small.",
+}
+
+Window = Tuple[int, int]  # minutes since local midnight, [start, end)
+
+
+def _hm(m: int) -> str:
+    return f"{m // 60:02d}:{m % 60:02d}"
+
+
+def _parse_hm(s: str) -> int:
+    h, m = s.split(":")[:2]
+    return int(h) * 60 + int(m)
+
+
+def _minute_of_day(iso: Optional[str], day: datetime) -> Optional[int]:
+    if not iso:
+        return None
+    dt = datetime.fromisoformat(iso).replace(tzinfo=None)
+    m = int((dt - day).total_seconds() // 60)
+    return max(0, min(24 * 60, m))
+
+
+def _free_windows(context: Dict[str, Any], day: datetime, now_min: int) -> List[Window]:
+    lo = max(DAY_START[0] * 60 + DAY_START[1], now_min)
+    hi = DAY_END[0] * 60 + DAY_END[1]
+    if context.get("free") is not None:
+        raw = [(_parse_hm(w["start"]), _parse_hm(w["end"])) for w in context["free"]]
+    else:
+        busy = sorted(
+            (s, e)
+            for s, e in (
+                (_minute_of_day(ev.get("start"), day), _minute_of_day(ev.get("end"), day))
+                for ev in context.get("events", [])
+            )
+            if s is not None and e is not None and e > s
+        )
+        raw, cur = [], 0
+        for s, e in busy:
+            if s > cur:
+                raw.append((cur, s))
+            cur = max(cur, e)
+        raw.append((cur, 24 * 60))
+    out = []
+    for s, e in raw:
+        s, e = max(s, lo), min(e, hi)
+        if e - s >= MIN_BLOCK:
+            out.append((s, e))
+    return out
+
+
+def _days_left(task: Dict[str, Any], day: datetime) -> Optional[float]:
+    if not task.get("dueAt"):
+        return None
+    due = datetime.fromisoformat(task["dueAt"]).replace(tzinfo=None)
+    return (due - day).total_seconds() / 86400
+
+
+def _duration(task: Dict[str, Any]) -> int:
+    # Bigger levers get longer focus blocks: impact 1 -> 30m ... 5 -> 90m.
+    return 15 * (int(task.get("impact") or 1) + 1)
+
+
+def _priority(task: Dict[str, Any], days_left: Optional[float]) -> float:
+    p = 2.0 * int(task.get("impact") or 1)
+    if days_left is not None:
+        p += 6.0 if days_left <= 1 else max(0.0, 4.0 - days_left / 2)
+    return p
+
+
+def solve(context: Dict[str, Any], now: Optional[datetime] = None) -> PlanPayload:
+    """Build a complete plan from the planner context; same inputs give the same plan.
+
+    `now` is user-local; blocks are only placed after it on the same day.
+    """
+    now = (now or datetime.now()).replace(tzinfo=None)
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    now_min = int((now - day).total_seconds() // 60)
+    windows = _free_windows(context, day, now_min)
+
+    tasks = []
+    for i, t in enumerate(context.get("tasks", [])):
+        left = _days_left(t, day)
+        tasks.append(
+            {
+                **t,
+                "_order": i,
+                "_left": left,
+                "_prio": _priority(t, left),
+                "_urgent": left is not None and left <= URGENT_DAYS,
+                "_important": int(t.get("impact") or 1) >= IMPORTANT_IMPACT,
+            }
+        )
+
+    # Greedy by priority, re-ranked after each placement so pillars stay balanced.
+    pillar_blocks: Dict[str, int] = {}
+    pending = list(tasks)
+    blocks: List[Tuple[int, int, str]] = []
+    scheduled: List[Dict[str, Any]] = []
+    while pending and windows:
+        pending.sort(
+            key=lambda t: (
+                -(t["_prio"] - PILLAR_PENALTY * pillar_blocks.get(t.get("pillar") or "", 0)),
+                t["_left"] if t["_left"] is not None else float("inf"),
+                t["_order"],
+            )
+        )
+        task = pending.pop(0)
+        need = _duration(task)
+        for wi, (ws, we) in enumerate(windows):
+            length = min(need, we - ws)
+            # Take the first window that fits, or a partial block if it is the last chance.
+            if length >= need or (length >= 30 and wi == len(windows) - 1):
+                blocks.append((ws, ws + length, task.get("title") or "Task"))
+                scheduled.append(task)
+                pillar_blocks[task.get("pillar") or ""] = pillar_blocks.get(task.get("pillar") or "", 0) + 1
+                rest = ws + length + BUFFER
+                windows[wi] = (rest, we)
+                windows = [(s, e) for s, e in windows if e - s >= MIN_BLOCK]
+                break
+
+    schedule = [
+        {"start": _hm(s), "end": _hm(e), "item": item} for s, e, item in blocks
+    ]
+    for ev in context.get("events", []):
+        s, e = _minute_of_day(ev.get("start"), day), _minute_of_day(ev.get("end"), day)
+        if s is not None and e is not None:
+            schedule.append({"start": _hm(s), "end": _hm(e), "item": ev.get("title") or "Event"})
+    schedule.sort(key=lambda b: (b["start"], b["end"]))
+
+    def titles(urgent: bool, important: bool) -> List[str]:
+        ranked = sorted(
+            (t for t in tasks if t["_urgent"] == urgent and t["_important"] == important),
+            key=lambda t: (-t["_prio"], t["_order"]),
+        )
+        return [t.get("title") or "Task" for t in ranked]
+
+    needles = dict(DEFAULT_NEEDLES)
+    by_prio = sorted(tasks, key=lambda t: (-t["_prio"], t["_order"]))
+    for key, pillar in NEEDLE_PILLARS.items():
+        best = next((t for t in by_prio if (t.get("pillar") or "").lower() == pillar.lower()), None)
+        if best:
+            needles[key] = best.get("title") or needles[key]
+
+    nudges = [
+        {"at": _hm(max(0, s - 5)), "msg": f"Next: {item}"} for s, _e, item in sorted(blocks)[:3]
+    ]
+    stress_guide = [
+        {"trigger": s.get("trigger") or "stress", "action": s.get("coping") or "3-min box breathing"}
+        for s in context.get("stressors", [])
+        if s.get("trigger")
+    ] or [{"trigger": "calendar overload", "action": "Declutter + 3-min box breathing"}]
+
+    return PlanPayload(
+        eisenhower={
+            "urgent_important": titles(True, True),
+            "urgent_not_important": titles(True, False),
+            "not_urgent_important": titles(False, True),
+            "not_urgent_not_important": titles(False, False),
+        },
+        three_needles=needles,
+        schedule=schedule,
+        affirmations=dict(DEFAULT_AFFIRMATIONS),
+        stress_guide=stress_guide,
+        nudges=nudges,
+    )
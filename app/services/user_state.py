@@ -0,0 +1,266 @@
+"""
+Per-user derived state for the agent's nudges.
+
+`suggest_next_actions` reads a few small per-user counters instead of
+scanning goals/tasks/events:
+
+  flag       goal flag -> number of goals that raise it (health, relationships, ...)
+  open_task  pillar -> number of open tasks ("none" for tasks without a pillar)
+
+plus the per-category latest start already kept in `activity_rollup`.
+
+Each counter is its own `user_state_count` row, and writers report what
+changed (`goal_changed`, `task_changed`) as a single `n = n + delta`
+statement, so concurrent writers cannot lose each other's increments and
+nothing rescans the user's rows. A user without a `user_state` row yet gets
+a full `rebuild` instead (which already sees the pending change), and
+`snapshot` recounts once the last rebuild is older than
+settings.user_state_reconcile_s, so drift from anything that bypasses the
+hooks heals on its own. None of these commit.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects import postgresql as pg_dialect, sqlite as sqlite_dialect
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.activity import ActivityRollup
+from app.models.common import now_utc
+from app.models.goal import Goal
+from app.models.task import Task
+from app.models.user_state import UserState, UserStateCount
+
+GoalKey = Tuple[str, str]  # (text, horizon)
+TaskKey = Tuple[Optional[str], str]  # (pillar, status)
+
+# flag -> (horizons it applies to, substrings); same rules suggest_next_actions always used.
+GOAL_FLAGS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "health": (("short",), ("lose", "weight", "health")),
+    "relationships": (("short", "long"), ("friends", "family", "husband", "parents", "relationships")),
+    "meditation": (("short", "long"), ("medit",)),
+    "finance": (("short", "long"), ("invest", "finance", "house", "vti", "eb1", "immigration", "file")),
+}
+NO_PILLAR = "none"
+FLAG, OPEN_TASK = "flag", "open_task"  # user_state_count.kind
+
+
+def horizon_group(horizon: Optional[str]) -> Optional[str]:
+    h = horizon or ""
+    if h.startswith("short") or h in ("14d", "90d"):
+        return "short"
+    if h.startswith("long") or h == "12m":
+        return "long"
+    return None
+
+
+def goal_flags(text: Optional[str], horizon: Optional[str]) -> Set[str]:
+    group = horizon_group(horizon)
+    if group is None:
+        return set()
+    lowered = (text or "").lower()
+    return {
+        flag
+        for flag, (groups, words) in GOAL_FLAGS.items()
+        if group in groups and any(w in lowered for w in words)
+    }
+
+
+def goal_key(g: Goal) -> GoalKey:
+    return (g.text, g.horizon)
+
+
+def task_key(t: Task) -> TaskKey:
+    return (t.pillar, t.status or "open")
+
+
+def _insert(db: Session):
+    """The dialect's INSERT with ON CONFLICT support, or None for the generic fallback."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite_dialect.insert
+    if dialect == "postgresql":
+        return pg_dialect.insert
+    return None
+
+
+def _bump(db: Session, user_id: str, kind: str, key: str, delta: int) -> None:
+    """Atomic `n = n + delta` on one counter row (same shape as versions.bump)."""
+    insert = _insert(db)
+    if insert is not None:
+        stmt = insert(UserStateCount).values(user_id=user_id, kind=kind, key=key, n=delta)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["user_id", "kind", "key"],
+                set_={"n": UserStateCount.n + delta},
+            )
+        )
+        return
+    done = db.execute(
+        update(UserStateCount)
+        .where(UserStateCount.user_id == user_id, UserStateCount.kind == kind, UserStateCount.key == key)
+        .values(n=UserStateCount.n + delta)
+    ).rowcount
+    if not done:
+        db.add(UserStateCount(user_id=user_id, kind=kind, key=key, n=delta))
+        db.flush()
+
+
+def _touch(db: Session, user_id: str) -> bool:
+    """Stamp updated_at; False (after a full rebuild) if the user had no state yet."""
+    done = db.execute(
+        update(UserState).where(UserState.user_id == user_id).values(updated_at=now_utc())
+    ).rowcount
+    if not done:
+        rebuild(db, user_id)
+    return bool(done)
+
+
+def goal_changed(db: Session, user_id: str, before: Optional[GoalKey], after: Optional[GoalKey]) -> None:
+    """Adjust goal flags for an insert (before=None), delete (after=None) or edit."""
+    old = goal_flags(*before) if before else set()
+    new = goal_flags(*after) if after else set()
+    if old == new or not _touch(db, user_id):
+        return
+    for f in old - new:
+        _bump(db, user_id, FLAG, f, -1)
+    for f in new - old:
+        _bump(db, user_id, FLAG, f, 1)
+
+
+def task_changed(db: Session, user_id: str, before: Optional[TaskKey], after: Optional[TaskKey]) -> None:
+    """Adjust open-task counts for an insert, delete, pillar change or status toggle."""
+    old = (before[0] or NO_PILLAR) if before and before[1] == "open" else None
+    new = (after[0] or NO_PILLAR) if after and after[1] == "open" else None
+    if old == new or not _touch(db, user_id):
+        return
+    if old:
+        _bump(db, user_id, OPEN_TASK, old, -1)
+    if new:
+        _bump(db, user_id, OPEN_TASK, new, 1)
+
+
+def rebuild(db: Session, user_id: str) -> UserState:
+    """Recount the snapshot from goals and open tasks, replacing the counter rows."""
+    db.flush()
+    flags: Dict[str, int] = {}
+    for text, horizon in db.query(Goal.text, Goal.horizon).filter(Goal.user_id == user_id):
+        for f in goal_flags(text, horizon):
+            flags[f] = flags.get(f, 0) + 1
+    open_tasks = {
+        (pillar or NO_PILLAR): n
+        for pillar, n in db.query(Task.pillar, func.count())
+        .filter(Task.user_id == user_id, Task.status == "open")
+        .group_by(Task.pillar)
+    }
+    db.execute(delete(UserStateCount).where(UserStateCount.user_id == user_id))
+    for kind, counts in ((FLAG, flags), (OPEN_TASK, open_tasks)):
+        for key, n in counts.items():
+            db.add(UserStateCount(user_id=user_id, kind=kind, key=key, n=n))
+    now = now_utc()
+    row = db.get(UserState, user_id)
+    if row is None:
+        row = UserState(user_id=user_id)
+        db.add(row)
+    row.rebuilt_at = row.updated_at = now
+    db.flush()
+    return row
+
+
+def snapshot(db: Session, user_id: str, now: datetime | None = None) -> Dict[str, Any]:
+    """Flags, open-task coverage and whole days since each activity category.
+
+    Recounts first if the user has no state yet or the last recount is older
+    than settings.user_state_reconcile_s, so any drift is bounded."""
+    row = db.get(UserState, user_id)
+    stale = datetime.utcnow() - timedelta(seconds=settings.user_state_reconcile_s)
+    if row is None or row.rebuilt_at is None or row.rebuilt_at < stale:
+        rebuild(db, user_id)
+    counts: Dict[str, Dict[str, int]] = {FLAG: {}, OPEN_TASK: {}}
+    for kind, key, n in db.query(UserStateCount.kind, UserStateCount.key, UserStateCount.n).filter(
+        UserStateCount.user_id == user_id, UserStateCount.n > 0
+    ):
+        counts.setdefault(kind, {})[key] = n
+    now = now or datetime.utcnow()
+    return {
+        "flags": set(counts[FLAG]),
+        "open_tasks": counts[OPEN_TASK],
+        "days_since": {
+            cat: (now - last.replace(tzinfo=None)).days
+            for cat, last in db.query(ActivityRollup.category, ActivityRollup.last_start).filter(
+                ActivityRollup.user_id == user_id, ActivityRollup.last_start.isnot(None)
+            )
+        },
+    }
+
+
+def next_actions(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Advice and suggested tasks for a `snapshot`; shared by the agent's
+    `suggest_next_actions` tool and the scheduled daily plan.
+    Rules of thumb:
+      - If 'lose' or 'weight' is in short goals and no health event in 7d -> suggest exercise task.
+      - If 'friends'/'family' relationship goals and no social event in 10d -> suggest social reach-out.
+      - If 'meditation' is a coping strategy and not scheduled in AM -> suggest AM 10m meditation.
+      - If finance/invest appears in goals -> suggest 'invest VTI %salary' or review funds weekly.
+    """
+    flags, since = state["flags"], state["days_since"]
+    advice: List[str] = []
+    suggested_tasks: List[Dict[str, Any]] = []
+
+    # Health cadence
+    since_health = since.get("health") or 999
+    if "health" in flags and since_health > 7:
+        advice.append(
+            f"It’s been {since_health} days since a health activity; schedule a 30m workout."
+        )
+        suggested_tasks.append(
+            {"title": "30m strength or 3-mile walk", "pillar": "Health", "impact": 5}
+        )
+
+    # Relationships cadence
+    since_rel = since.get("relationships") or 999
+    if "relationships" in flags and since_rel > 10:
+        advice.append(
+            f"No social time logged in {since_rel} days; message a friend and schedule dinner."
+        )
+        suggested_tasks.append(
+            {
+                "title": "Text a friend & set dinner",
+                "pillar": "Relationships",
+                "impact": 4,
+            }
+        )
+
+    # Meditation / affirmations nudges
+    if "meditation" in flags:
+        advice.append(
+            "Add 10m morning meditation + 2-line gratitude to stabilize mood."
+        )
+        suggested_tasks.append(
+            {
+                "title": "10m morning meditation + gratitude",
+                "pillar": "Personal",
+                "impact": 4,
+            }
+        )
+
+    # Finance nudges
+    if "finance" in flags:
+        advice.append(
+            "Block 25m for finances: review VTI auto-invest %, set EB1 document task, and weekly money review."
+        )
+        suggested_tasks.append(
+            {
+                "title": "Finance block: review VTI %, EB1 docs",
+                "pillar": "Money",
+                "impact": 5,
+            }
+        )
+
+    return {
+        "advice": advice,
+        "suggested_tasks": suggested_tasks,
+        "open_tasks_by_pillar": state["open_tasks"],
+    }
@@ -0,0 +1,104 @@
+"""
+Per-user, per-resource version counters behind the ETags of the dashboard
+and the list endpoints.
+
+Writers call `bump(db, user_id, resource)` BEFORE committing, so the new
+version lands in the same transaction as the rows it describes and every
+worker (or replica reader) sees both or neither. A GET builds its tag from
+the stored version (one primary-key read) before loading anything, so a
+client revalidating an unchanged resource gets `304 Not Modified` without a
+row query or a template render.
+
+Tags also carry a digest of the templates, so a deploy that changes the
+markup invalidates them even though the counters survive it.
+"""
+import hashlib
+from pathlib import Path
+from typing import Any, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql as pg_dialect, sqlite as sqlite_dialect
+from sqlalchemy.orm import Session
+
+from app.models.common import now_utc
+from app.models.resource_version import ResourceVersion
+
+RESOURCES = ("tasks", "goals", "stress", "plan")
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates"
+
+# Revalidate on every request; the browser then sends If-None-Match by itself.
+CACHE_CONTROL = "private, no-cache"
+
+
+def _templates_digest() -> str:
+    h = hashlib.sha1()
+    for p in sorted(TEMPLATES_DIR.glob("*.html")):
+        h.update(p.name.encode())
+        h.update(p.read_bytes())
+    return h.hexdigest()[:8]
+
+
+BUILD = _templates_digest()
+
+
+def current(db: Session, user_id: str, resource: str) -> int:
+    v = db.scalar(
+        select(ResourceVersion.version).where(
+            ResourceVersion.user_id == user_id, ResourceVersion.resource == resource
+        )
+    )
+    return v or 0
+
+
+def bump(db: Session, user_id: str, *resources: str) -> None:
+    """Increment the counters inside the caller's transaction. Does not commit."""
+    dialect = db.get_bind().dialect.name
+    now = now_utc()
+    for r in resources:
+        if dialect in ("sqlite", "postgresql"):
+            mod = sqlite_dialect if dialect == "sqlite" else pg_dialect
+            stmt = mod.insert(ResourceVersion).values(user_id=user_id, resource=r, version=1, updated_at=now)
+            db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["user_id", "resource"],
+                    set_={"version": ResourceVersion.version + 1, "updated_at": now},
+                )
+            )
+            continue
+        # Generic fallback: UPDATE, then INSERT the first version.
+        done = db.execute(
+            update(ResourceVersion)
+            .where(ResourceVersion.user_id == user_id, ResourceVersion.resource == r)
+            .values(version=ResourceVersion.version + 1, updated_at=now)
+        ).rowcount
+        if not done:
+            db.add(ResourceVersion(user_id=user_id, resource=r, version=1, updated_at=now))
+            db.flush()
+
+
+def etag(db: Session, user_id: str, resource: str, *salt: Any) -> str:
+    """Weak tag over (resource version, request variant such as cursor/limit/date)."""
+    variant = hashlib.sha1(repr((user_id, *salt)).encode()).hexdigest()[:12]
+    return f'W/"{BUILD}-{resource}-{current(db, user_id, resource)}-{variant}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def not_modified(request: Request, tag: str) -> Optional[Response]:
+    """A 304 for `tag` if the client's If-None-Match already has it (weak comparison), else None."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    if header.strip() != "*" and _opaque(tag) not in {_opaque(t) for t in header.split(",")}:
+        return None
+    return Response(status_code=304, headers={"ETag": tag, "Cache-Control": CACHE_CONTROL})
+
+
+def tagged(response: Response, tag: str) -> Response:
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response